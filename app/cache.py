@@ -0,0 +1,197 @@
+"""In-process caches with bounded size and entry lifetime."""
+
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Least-recently-used cache with a time-to-live for each entry.
+
+    At most maxsize entries are kept; a maxsize of zero disables the
+    cache. Entries older than ttl seconds are treated as missing. Hits
+    and misses are counted for monitoring.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Get the number of entries, including any expired ones."""
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        """Get the value for key, or None if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        """Store value for key, evicting the least recently used entry."""
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        """Remove the entry for key, if present."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Get the size and hit/miss counts."""
+        return {"size": len(self._entries), "hits": self.hits,
+                "misses": self.misses}
+
+
+class ExistenceCache:
+    """Cache of the (model, id) pairs known to exist in the database.
+
+    Only positive results are stored, so a miss must always be checked
+    in the database: a newly created item is never reported as missing.
+    Memory is bounded by the LRU eviction. Any object with the same
+    methods can be used in its place.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._ids: LRUCache[tuple[type, int], bool] = LRUCache(maxsize, ttl)
+
+    def contains(self, model: type, object_id: int) -> bool:
+        """Check whether the item is known to exist."""
+        return self._ids.get((model, object_id)) is not None
+
+    def add(self, model: type, object_id: int) -> None:
+        """Record that the item exists."""
+        self._ids.put((model, object_id), True)
+
+    def discard(self, model: type, object_id: int) -> None:
+        """Forget the item, e.g. after it is deleted."""
+        self._ids.invalidate((model, object_id))
+
+    def clear(self) -> None:
+        """Forget all items and reset the counters."""
+        self._ids.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Get the size and hit/miss counts."""
+        return self._ids.stats()
+
+
+class ResultCache:  # pylint: disable=R0902
+    """LRU cache of serialised query results, grouped by patient.
+
+    Each entry is the response body bytes plus headers, stored under a
+    (patient_id, key) pair. Memory use is bounded by max_bytes, counting
+    the body and header lengths, by evicting the least recently used
+    entries. A max_bytes of zero disables the cache.
+
+    All entries for a patient are removed by invalidate(patient_id).
+    A result read before an invalidation is not stored afterwards: put()
+    is given the patient generation() obtained before the read.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries: OrderedDict[
+            tuple[int, str],
+            tuple[float, bytes, dict[str, str], int]] = OrderedDict()
+        self._keys_by_patient: dict[int, set[str]] = {}
+        self._generations: dict[int, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """Check whether results can be stored."""
+        return self.max_bytes > 0
+
+    def generation(self, patient_id: int) -> int:
+        """Get the number of invalidations for a patient."""
+        return self._generations.get(patient_id, 0)
+
+    def get(self, patient_id: int,
+            key: str) -> tuple[bytes, dict[str, str]] | None:
+        """Get the body and headers, or None if absent or expired."""
+        entry = self._entries.get((patient_id, key))
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(patient_id, key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end((patient_id, key))
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, patient_id: int, key: str, body: bytes,
+            headers: dict[str, str], generation: int) -> None:
+        """Store a result read at the given patient generation."""
+        size = len(body) + sum(len(k) + len(v) for k, v in headers.items())
+        if (not self.enabled or size > self.max_bytes
+                or generation != self.generation(patient_id)):
+            return
+        self._remove(patient_id, key)
+        self._entries[(patient_id, key)] = (
+            time.monotonic() + self.ttl, body, headers, size)
+        self._keys_by_patient.setdefault(patient_id, set()).add(key)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            (old_patient_id, old_key), _ = next(iter(self._entries.items()))
+            self._remove(old_patient_id, old_key)
+            self.evictions += 1
+
+    def invalidate(self, patient_id: int) -> None:
+        """Remove all results for a patient, e.g. after a write."""
+        self._generations[patient_id] = self.generation(patient_id) + 1
+        for key in list(self._keys_by_patient.get(patient_id, ())):
+            self._remove(patient_id, key)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        self._entries.clear()
+        self._keys_by_patient.clear()
+        self._generations.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+
+    def stats(self) -> dict[str, float]:
+        """Get the size, counts and hit rate."""
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "size_bytes": self.size_bytes,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def _remove(self, patient_id: int, key: str) -> None:
+        entry = self._entries.pop((patient_id, key), None)
+        if entry is None:
+            return
+        self.size_bytes -= entry[3]
+        keys = self._keys_by_patient[patient_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_patient[patient_id]
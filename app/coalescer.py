@@ -0,0 +1,157 @@
+"""Group commit of concurrent medication request inserts.
+
+Each create request normally commits its own transaction, so under
+concurrent load the commit (and its fsync) limits the throughput. The
+WriteCoalescer collects the inserts arriving within a short window, or
+up to a maximum batch size, and commits them as one transaction. Each
+caller still gets its own new row or its own error.
+"""
+
+import asyncio
+from typing import NamedTuple, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import crud
+from .metrics import registry
+from .models.medication_request import (
+    MedicationRequest,
+    MedicationRequestInput
+)
+
+
+class _PendingInsert(NamedTuple):
+    patient_id: int
+    medication_request_input: MedicationRequestInput
+    future: asyncio.Future
+    queued_at: float
+
+
+class WriteCoalescer:  # pylint: disable=R0902
+    """Insert MedicationRequests from concurrent callers in shared batches.
+
+    A batch is written when window seconds have passed since its first
+    item was queued, or as soon as it has max_batch_size items. The
+    batch sizes and the time that items wait to be written are recorded
+    for monitoring.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession],
+                 window: float, max_batch_size: int):
+        self.session_maker = session_maker
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+        self._pending: list[_PendingInsert] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def create_medication_request(
+            self, medication_request_input: MedicationRequestInput,
+            patient_id: int) -> MedicationRequest:
+        """Create a new MedicationRequest, as crud.create_medication_request.
+
+        This returns when the batch containing the item is committed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_PendingInsert(
+            patient_id, medication_request_input, future, loop.time()))
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._start_flush)
+        return await future
+
+    async def close(self) -> None:
+        """Write any queued items and wait for all batches to finish."""
+        self._start_flush()
+        await asyncio.gather(*self._flushes)
+
+    def stats(self) -> dict[str, float]:
+        """Get the batch counts, mean batch size and mean wait (s)."""
+        return {"batches": self.batches, "items": self.items,
+                "largest_batch": self.largest_batch,
+                "mean_batch_size": (self.items / self.batches
+                                    if self.batches else 0.0),
+                "mean_wait_seconds": (self.total_wait / self.items
+                                      if self.items else 0.0)}
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[_PendingInsert]) -> None:
+        """Record the batch metrics, then write the batch."""
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        now = asyncio.get_running_loop().time()
+        self.total_wait += sum(now - item.queued_at for item in batch)
+        await self._write(batch)
+
+    async def _write(self, batch: list[_PendingInsert]) -> None:
+        """Write a batch, or each item alone if the batch fails."""
+        results: Sequence[MedicationRequest | Exception]
+        try:
+            results = await self._insert(batch)
+        except Exception as exc:  # pylint: disable=W0718
+            if len(batch) == 1:
+                results = [exc]
+            else:
+                # One bad item must not fail the others.
+                for item in batch:
+                    await self._write([item])
+                return
+        for item, result in zip(batch, results):
+            if item.future.done():  # the caller was cancelled
+                continue
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+    async def _insert(
+            self, batch: list[_PendingInsert]
+    ) -> list[MedicationRequest | crud.ResourceNotFoundError]:
+        """Insert and commit a batch in one transaction."""
+        async with self.session_maker() as db:
+            async with db.begin():
+                results = await crud.insert_medication_requests(
+                    db, [(item.patient_id, item.medication_request_input)
+                         for item in batch])
+        for patient_id in {item.patient_id for item in batch}:
+            crud.record_write(patient_id)
+        return results
+
+
+# The coalescer of each shard used by the POST route, if enabled in the
+# app lifespan.
+writers: list[WriteCoalescer] = []
+
+
+def _stat(name: str):
+    """Make a callback reading one of the stats of each shard's writer."""
+    return lambda: {str(shard): writer.stats()[name]
+                    for shard, writer in enumerate(writers)}
+
+
+registry.counter("write_coalescer_batches_total", "Batches written",
+                 _stat("batches"), "shard")
+registry.counter("write_coalescer_items_total", "Items written in batches",
+                 _stat("items"), "shard")
+registry.gauge("write_coalescer_mean_batch_size", "Mean items per batch",
+               _stat("mean_batch_size"), "shard")
+registry.gauge("write_coalescer_mean_wait_seconds",
+               "Mean time items wait for their batch to be written",
+               _stat("mean_wait_seconds"), "shard")
@@ -0,0 +1,45 @@
+"""Export medication requests, with the reference names, to a file.
+
+Run with: python -m app.commands.export [--patient-id N]
+[--format jsonl|csv] [--gzip] [--output FILE]. The output is written to
+stdout unless a file is given. The database is given by DATABASE_URL.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .. import export, settings
+
+
+async def main(argv: list[str] | None = None) -> None:
+    """Export to the file given on the command line."""
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n", maxsplit=1)[0])
+    parser.add_argument("--patient-id", type=int,
+                        help="export only this patient (default: all)")
+    parser.add_argument("--format", choices=export.FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--output", help="output file (default: stdout)")
+    parser.add_argument("--chunk-size", type=int,
+                        default=settings.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    engine = create_async_engine(os.environ["DATABASE_URL"])
+    try:
+        with contextlib.ExitStack() as files:
+            output = (files.enter_context(open(args.output, "wb"))
+                      if args.output else sys.stdout.buffer)
+            async for data in export.export_bytes(
+                    async_sessionmaker(engine), args.patient_id,
+                    args.format, args.gzip, args.chunk_size):
+                output.write(data)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
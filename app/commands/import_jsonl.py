@@ -0,0 +1,210 @@
+"""Bulk import of medication requests from a JSON Lines file.
+
+Each line is one medication request: the MedicationRequestInput fields
+plus patient_id. The file is read and written in batches, so memory use
+does not depend on the file size. Each batch is validated, has its
+patient, clinician and medication ids checked with one query per type,
+and is written in one transaction: with COPY on PostgreSQL, or a
+multi-row INSERT on other databases. Invalid lines are skipped, and can
+be written to a rejects file.
+
+Run with: python -m app.commands.import_jsonl FILE [--batch-size N]
+[--rejects FILE]. The database is given by DATABASE_URL.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import IO, Any, Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import (
+    AsyncSession, async_sessionmaker, create_async_engine
+)
+
+from .. import crud
+from ..models.clinician import Clinician
+from ..models.medication import Medication
+from ..models.medication_request import (
+    MedicationRequest,
+    MedicationRequestInput
+)
+from ..models.patient import Patient
+from ..models.types import ModelInvalidError
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 5.0
+
+
+class MedicationRequestRecord(MedicationRequestInput):
+    """One line of the import file."""
+
+    patient_id: int
+
+
+@dataclass
+class ImportProgress:
+    """Counts of the lines imported and rejected so far."""
+
+    imported: int = 0
+    rejected: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def rows_per_second(self) -> float:
+        """Get the mean import rate."""
+        elapsed = time.monotonic() - self.started
+        return self.imported / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        """Get a one-line summary."""
+        return (f"{self.imported} imported, {self.rejected} rejected, "
+                f"{self.rows_per_second:.0f} rows/s")
+
+
+def _batches(lines: Iterable[str],
+             batch_size: int) -> Iterator[list[tuple[int, str]]]:
+    """Split the non-blank lines into numbered batches."""
+    numbered = ((number, line) for number, line in enumerate(lines, 1)
+                if line.strip())
+    while batch := list(itertools.islice(numbered, batch_size)):
+        yield batch
+
+
+def _validate(
+        batch: list[tuple[int, str]], rejects: IO[str] | None,
+        progress: ImportProgress
+) -> list[tuple[int, MedicationRequestRecord]]:
+    """Parse and validate each line, rejecting any invalid ones."""
+    records = []
+    for number, line in batch:
+        try:
+            records.append(
+                (number, MedicationRequestRecord.model_validate_json(line)))
+        except ValidationError as exc:
+            _reject(number, str(exc.errors(include_url=False)),
+                    rejects, progress)
+        except ModelInvalidError as exc:
+            _reject(number, exc.message, rejects, progress)
+    return records
+
+
+def _reject(number: int, reason: str, rejects: IO[str] | None,
+            progress: ImportProgress) -> None:
+    progress.rejected += 1
+    if rejects is not None:
+        rejects.write(json.dumps({"line": number, "error": reason}) + "\n")
+
+
+async def _check_references(
+        db: AsyncSession, records: list[tuple[int, MedicationRequestRecord]],
+        rejects: IO[str] | None,
+        progress: ImportProgress) -> list[MedicationRequestRecord]:
+    """Reject the records with a missing patient, clinician or medication.
+
+    This uses one query per entity type, for ids not already cached.
+    """
+    patient_ids = await crud.existing_ids(
+        db, (x.patient_id for _, x in records), Patient)
+    clinician_ids = await crud.existing_ids(
+        db, (x.clinician_id for _, x in records), Clinician)
+    medication_ids = await crud.existing_ids(
+        db, (x.medication_id for _, x in records), Medication)
+    valid = []
+    for number, record in records:
+        if (record.patient_id in patient_ids
+                and record.clinician_id in clinician_ids
+                and record.medication_id in medication_ids):
+            valid.append(record)
+        else:
+            _reject(number, "Missing patient, clinician or medication.",
+                    rejects, progress)
+    return valid
+
+
+def _copy_value(value: Any) -> Any:
+    """Convert a field value for COPY, which needs enum values as str."""
+    return value.value if isinstance(value, Enum) else value
+
+
+async def _write(db: AsyncSession,
+                 records: list[MedicationRequestRecord]) -> None:
+    """Write the records, with COPY if the driver is asyncpg."""
+    columns = list(MedicationRequestRecord.model_fields)
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg":
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(  # type: ignore
+            MedicationRequest.__tablename__, columns=columns,
+            records=[tuple(_copy_value(getattr(record, name))
+                           for name in columns)
+                     for record in records])
+    else:
+        await db.execute(insert(MedicationRequest.__table__),  # type: ignore
+                         [record.model_dump() for record in records])
+
+
+async def import_medication_requests(
+        session_maker: async_sessionmaker[AsyncSession],
+        lines: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE,
+        rejects: IO[str] | None = None,
+        report: IO[str] | None = None) -> ImportProgress:
+    """Import medication requests from JSON lines, in batches.
+
+    Lines which are invalid, or refer to a missing patient, clinician or
+    medication, are rejected. The progress is written to report at
+    intervals, and the final counts are returned.
+    """
+    progress = ImportProgress()
+    last_report = progress.started
+    for batch in _batches(lines, batch_size):
+        records = _validate(batch, rejects, progress)
+        async with session_maker() as db:
+            async with db.begin():
+                valid = await _check_references(db, records, rejects,
+                                                progress)
+                if valid:
+                    await _write(db, valid)
+        progress.imported += len(valid)
+        if (report is not None
+                and time.monotonic() - last_report >= PROGRESS_INTERVAL):
+            last_report = time.monotonic()
+            report.write(f"{progress}\n")
+    return progress
+
+
+async def main(argv: list[str] | None = None) -> None:
+    """Import a file given on the command line."""
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n", maxsplit=1)[0])
+    parser.add_argument("file", help="JSON Lines file to import")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rejects", help="file for the rejected lines")
+    args = parser.parse_args(argv)
+    engine = create_async_engine(os.environ["DATABASE_URL"])
+    try:
+        with contextlib.ExitStack() as files:
+            lines = files.enter_context(open(args.file, encoding="utf-8"))
+            rejects = (files.enter_context(
+                open(args.rejects, "w", encoding="utf-8"))
+                if args.rejects else None)
+            progress = await import_medication_requests(
+                async_sessionmaker(engine), lines, args.batch_size,
+                rejects, sys.stderr)
+    finally:
+        await engine.dispose()
+    print(f"Done: {progress}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+"""Move a patient's medication requests to another database shard.
+
+Run with: python -m app.commands.rebalance PATIENT_ID SHARD. The shards
+are given by DATABASE_URL (shard 0) and DATABASE_SHARD_URLS. Processes
+serving the API use the new shard once their cached directory entry
+expires (SHARD_DIRECTORY_TTL_SECONDS).
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .. import settings, sharding
+
+
+async def main(argv: list[str] | None = None) -> None:
+    """Move the patient given on the command line."""
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n", maxsplit=1)[0])
+    parser.add_argument("patient_id", type=int)
+    parser.add_argument("shard", type=int, help="target shard number")
+    args = parser.parse_args(argv)
+    urls = [os.environ["DATABASE_URL"], *settings.DATABASE_SHARD_URLS]
+    if not 0 <= args.shard < len(urls):
+        parser.error(f"shard must be from 0 to {len(urls) - 1}")
+    engines = [create_async_engine(url) for url in urls]
+    try:
+        moved = await sharding.move_patient(
+            [async_sessionmaker(engine) for engine in engines],
+            args.patient_id, args.shard)
+    finally:
+        for engine in engines:
+            await engine.dispose()
+    print(f"Moved {moved} medication requests of patient "
+          f"{args.patient_id} to shard {args.shard}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,43 @@
 """Create, replace, update, delete functions for database access."""
 
-from typing import Type
+import functools
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any, Type, AsyncIterator, Awaitable, Callable, Collection, Iterable,
+    Iterator, Sequence, TypeVar
+)
 
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import (
+    select, exists, tuple_, event, insert, update, delete, bindparam,
+    Integer
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import noload
 from pydantic import BaseModel
 
 from .models.medication_request import (
     MedicationRequestInput,
     MedicationRequest,
     MedicationRequestPatch,
-    MedicationRequestQueryParams
+    MedicationRequestQueryParams,
+    MedicationRequestCursor,
+    MedicationRequestOutput,
+    MedicationRequestDateRange,
+    MedicationRequestTransition
 )
 from .models.clinician import Clinician
 from .models.patient import Patient
+from .models.idempotency_key import IdempotencyKey
 from .models.medication import Medication
 from .models.types import HasId
+from . import settings
+from . import reference
+from . import replicas
+from .cache import ExistenceCache, ResultCache
+from .metrics import registry
+from .serialization import output_from_row, OUTPUT_COLUMNS
 
 
 class ResourceNotFoundError(Exception):
@@ -41,92 +63,669 @@ class PatientIDMismatchError(Exception):
         self.message = message
 
 
+class VersionConflictError(Exception):
+    """Exception raised if a resource is not at the expected version.
+
+    This is when another update has been made since the version was read.
+    """
+
+    def __init__(self):
+        message = "The medication request has been modified."
+        super().__init__(message)
+        self.message = message
+
+
+class IdempotencyKeyReuseError(Exception):
+    """Exception raised if an idempotency key is reused for a new request.
+
+    This is when the request content differs from that of the request
+    first made with the key.
+    """
+
+    def __init__(self):
+        message = "The idempotency key was used for a different request."
+        super().__init__(message)
+        self.message = message
+
+
+# Session.info key marking a session used by an unfinished crud call.
+_IN_CRUD_CALL = "in_crud_call"
+
+F = TypeVar("F", bound=Callable[..., Awaitable])
+
+
+def _unit_of_work(function: F) -> F:
+    """Make a crud function end the session's transaction on return.
+
+    The session checks out a connection on its first statement, and
+    returns it to the pool when the transaction ends. Committing (or, on
+    error, rolling back) as the outermost crud call returns means that a
+    request only holds a connection while it queries, and not while its
+    response is serialised and sent. A transaction begun by the caller is
+    left open.
+    """
+    @functools.wraps(function)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        if db.in_transaction() or db.info.get(_IN_CRUD_CALL):
+            return await function(db, *args, **kwargs)
+        db.info[_IN_CRUD_CALL] = True
+        try:
+            result = await function(db, *args, **kwargs)
+            if db.in_transaction():
+                await db.commit()
+            return result
+        except BaseException:
+            if db.in_transaction():
+                await db.rollback()
+            raise
+        finally:
+            del db.info[_IN_CRUD_CALL]
+    return wrapper  # type: ignore
+
+
+# Query options to load a MedicationRequest without joining the
+# reference data, whose names are instead obtained from the cache.
+_WITHOUT_REFERENCES = (
+    noload(MedicationRequest.medication),  # type: ignore
+    noload(MedicationRequest.clinician))  # type: ignore
+
+
+# The medicationrequest columns needed for MedicationRequestOutput.
+_OUTPUT_COLUMNS = tuple(getattr(MedicationRequest, name)
+                        for name in OUTPUT_COLUMNS)
+
+
+async def _with_names(
+        db: AsyncSession, medication_requests: Sequence[Any]
+) -> list[MedicationRequestOutput]:
+    """Make output models, adding the cached reference names.
+
+    The medication requests can be ORM objects or output column rows.
+    """
+    medications, clinicians = await reference.resolve_names(
+        db, (x.medication_id for x in medication_requests),
+        (x.clinician_id for x in medication_requests))
+    return [output_from_row(x, medications[x.medication_id],
+                            clinicians[x.clinician_id])
+            for x in medication_requests]
+
+
+# Ids known to exist, checked before the database by id_exists. This can
+# be replaced by any object with the same interface.
+existence_cache = ExistenceCache(settings.EXISTENCE_CACHE_MAX_SIZE,
+                                 settings.EXISTENCE_CACHE_TTL_SECONDS)
+
+
+# Serialised collection results, which are stored by the router and
+# invalidated here by each write to a patient's medication requests.
+result_cache = ResultCache(settings.RESULT_CACHE_MAX_BYTES,
+                           settings.RESULT_CACHE_TTL_SECONDS)
+
+
+def record_write(patient_id: int) -> None:
+    """Note a committed write to a patient's medication requests.
+
+    The patient's cached results are removed, and the patient's reads
+    use the primary database for a while.
+    """
+    result_cache.invalidate(patient_id)
+    replicas.record_write(patient_id)
+
+
+registry.gauge("existence_cache_size", "Cached ids known to exist",
+               lambda: existence_cache.stats()["size"])
+registry.gauge("result_cache_size_bytes", "Size of the cached results",
+               lambda: result_cache.stats()["size_bytes"])
+registry.counter("result_cache_hits_total", "Result cache hits",
+                 lambda: result_cache.stats()["hits"])
+registry.counter("result_cache_misses_total", "Result cache misses",
+                 lambda: result_cache.stats()["misses"])
+registry.counter("result_cache_evictions_total", "Result cache evictions",
+                 lambda: result_cache.stats()["evictions"])
+
+
+@_unit_of_work
 async def id_exists(db: AsyncSession, object_id: int,
                     model: Type[HasId]) -> bool:
-    """Check for existence of item with id in database."""
-    statement = select(exists().where(model.id == object_id))  # type: ignore
-    result = await db.execute(statement)
-    return bool(result.scalar())
+    """Check for existence of item with id in database.
 
+    Items found to exist are cached; missing items are not. Patients
+are not cached if the database is sharded.
+    """
+    cached = _existence_cached(model)
+    if cached and existence_cache.contains(model, object_id):
+        return True
+    result = await db.execute(_exists_statement(model),
+                              {"object_id": object_id})
+    found = bool(result.scalar())
+    if found and cached:
+        existence_cache.add(model, object_id)
+    return found
 
-async def read_medication_request(
-        db: AsyncSession,
-        medication_request_id: int,
-        patient_id: int) -> MedicationRequest | None:
-    """Read a MedicationRequest from the database."""
-    if not await id_exists(db, patient_id, Patient):
+
+def _existence_cached(model: Type[HasId]) -> bool:
+    """Check whether ids of a model found to exist can be cached.
+
+    Patients are not cached when sharded, because a patient moved to
+    another shard is deleted from its old shard without any other
+    process knowing, and those can still use the old shard for a while.
+    """
+    return model is not Patient or not settings.DATABASE_SHARD_URLS
+
+
+@functools.cache
+def _exists_statement(model: Type[HasId]):
+    """Get the statement checking for the object_id parameter of a model."""
+    return select(exists().where(
+        model.id == bindparam("object_id")))  # type: ignore
+
+
+@event.listens_for(Patient, "after_delete")
+@event.listens_for(Clinician, "after_delete")
+@event.listens_for(Medication, "after_delete")
+def _forget_deleted(mapper, _connection, target: HasId):
+    """Remove a deleted item from the existence cache."""
+    if target.id is not None:
+        existence_cache.discard(mapper.class_, target.id)
+
+
+async def _read_owned_medication_request(
+        db: AsyncSession, medication_request_id: int, patient_id: int,
+        *columns):
+    """Read columns of a MedicationRequest belonging to a patient.
+
+    This uses a single statement: the patient row is outer-joined to the
+    medication request row, so that the absence of any result row means
+    that the patient does not exist, and an empty medication request
+    means that the medication request does not exist. The requested
+    columns follow the two id columns in the returned row.
+    """
+    row = (await db.execute(
+        _owned_statement(columns),
+        {"medication_request_id": medication_request_id,
+         "patient_id": patient_id})).first()
+    if row is None:
         raise ResourceNotFoundError(Patient)
-    medication_request = await db.get(MedicationRequest, medication_request_id)
-    if not medication_request:
+    if row[1] is None:
         raise ResourceNotFoundError(MedicationRequest)
-    if medication_request.patient_id != patient_id:
+    if row[1] != patient_id:
         raise PatientIDMismatchError()
-    return medication_request
+    return row
+
+
+@functools.cache
+def _owned_statement(columns: tuple):
+    """Get the statement of _read_owned_medication_request for columns."""
+    statement = (
+        select(Patient.id, MedicationRequest.patient_id,  # type: ignore
+               *columns)
+        .select_from(Patient)
+        .outerjoin(
+            MedicationRequest,
+            MedicationRequest.id  # type: ignore
+            == bindparam("medication_request_id"))
+        .where(Patient.id == bindparam("patient_id")))  # type: ignore
+    if any(column is MedicationRequest for column in columns):
+        statement = statement.options(*_WITHOUT_REFERENCES)
+    return statement
+
+
+@_unit_of_work
+async def read_medication_request(
+        db: AsyncSession,
+        medication_request_id: int,
+        patient_id: int) -> MedicationRequestOutput:
+    """Read a MedicationRequest from the database, in one statement."""
+    row = await _read_owned_medication_request(
+        db, medication_request_id, patient_id, MedicationRequest)
+    return (await _with_names(db, [row[2]]))[0]
+
 
+@_unit_of_work
+async def read_medication_request_version(
+        db: AsyncSession,
+        medication_request_id: int,
+        patient_id: int) -> int:
+    """Read only the version of a MedicationRequest from the database.
 
+    The errors raised are the same as for read_medication_request.
+    """
+    row = await _read_owned_medication_request(
+        db, medication_request_id, patient_id, MedicationRequest.version)
+    return row[2]
+
+
+@_unit_of_work
 async def create_medication_request(
         db: AsyncSession, medication_request_input: MedicationRequestInput,
         patient_id: int) -> MedicationRequest:
-    """Create a new MedicationRequest in the database."""
+    """Create a new MedicationRequest in the database.
+
+    The new row is read back by the INSERT statement itself, so there is
+    no refresh after the commit. The references are checked in the order
+    patient, clinician, medication.
+    """
+    async with db.begin():
+        result = (await insert_medication_requests(
+            db, [(patient_id, medication_request_input)]))[0]
+        if isinstance(result, ResourceNotFoundError):
+            raise result
+    await db.commit()
+    record_write(patient_id)
+    return result
+
+
+def _request_fingerprint(medication_request_input: MedicationRequestInput,
+                         patient_id: int) -> str:
+    """Get a digest identifying the content of a create request."""
+    digest = hashlib.sha256(str(patient_id).encode())
+    digest.update(medication_request_input.model_dump_json().encode())
+    return digest.hexdigest()
+
+
+def _idempotency_cutoff() -> datetime:
+    """Get the creation time before which idempotency keys expire."""
+    return (datetime.now(timezone.utc).replace(tzinfo=None)
+            - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS))
+
+
+async def _read_idempotency_key(db: AsyncSession, key: str,
+                                fingerprint: str) -> IdempotencyKey | None:
+    """Read an unexpired idempotency key, checking the fingerprint."""
+    row = (await db.execute(
+        select(*IdempotencyKey.__table__.c).where(  # type: ignore
+            IdempotencyKey.key == key,  # type: ignore
+            IdempotencyKey.created_at  # type: ignore
+            >= _idempotency_cutoff()))).first()
+    if row is None:
+        return None
+    if row.fingerprint != fingerprint:
+        raise IdempotencyKeyReuseError()
+    return IdempotencyKey(**row._asdict())
+
+
+@_unit_of_work
+async def create_idempotent_medication_request(
+        db: AsyncSession, medication_request_input: MedicationRequestInput,
+        patient_id: int, key: str) -> tuple[IdempotencyKey, bool]:
+    """Create a new MedicationRequest at most once per idempotency key.
+
+    A repeated request is answered from the stored key, by one primary
+    key lookup. Otherwise the MedicationRequest and the key are inserted
+    in one transaction, so a concurrent request with the same key fails
+    on the key and then reads the stored result. The second value
+    returned is True if the stored result was from an earlier request.
+    """
+    fingerprint = _request_fingerprint(medication_request_input, patient_id)
+    async with db.begin():
+        record = await _read_idempotency_key(db, key, fingerprint)
+    if record is not None:
+        return record, True
+    try:
+        async with db.begin():
+            await db.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.key == key,  # type: ignore
+                    IdempotencyKey.created_at  # type: ignore
+                    < _idempotency_cutoff()))
+            result = (await insert_medication_requests(
+                db, [(patient_id, medication_request_input)]))[0]
+            if isinstance(result, ResourceNotFoundError):
+                raise result
+            if result.id is None:
+                raise ValueError("The inserted medication request has no id")
+            record = IdempotencyKey(
+                key=key, fingerprint=fingerprint,
+                medication_request_id=result.id,
+                response_body=result.model_dump_json(),
+                created_at=datetime.now(timezone.utc).replace(tzinfo=None))
+            await db.execute(insert(IdempotencyKey), [record.model_dump()])
+    except IntegrityError:
+        async with db.begin():
+            record = await _read_idempotency_key(db, key, fingerprint)
+        if record is None:
+            raise
+        return record, True
+    record_write(patient_id)
+    return record, False
+
+
+@_unit_of_work
+async def delete_expired_idempotency_keys(db: AsyncSession) -> int:
+    """Delete the expired idempotency keys; return the number deleted."""
+    async with db.begin():
+        result = await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.created_at  # type: ignore
+                < _idempotency_cutoff()))
+    return result.rowcount  # type: ignore
+
+
+@_unit_of_work
+async def existing_ids(db: AsyncSession, object_ids: Iterable[int],
+                       model: Type[HasId]) -> set[int]:
+    """Find which of the ids exist in the database, in one query.
+
+    As for id_exists, ids known to exist are not queried again.
+    """
+    cached = _existence_cached(model)
+    found = set()
+    unknown = set()
+    for object_id in set(object_ids):
+        if cached and existence_cache.contains(model, object_id):
+            found.add(object_id)
+        else:
+            unknown.add(object_id)
+    if unknown:
+        result = await db.execute(
+            select(model.id).where(model.id.in_(unknown)))  # type: ignore
+        for object_id in result.scalars():
+            if cached:
+                existence_cache.add(model, object_id)
+            found.add(object_id)
+    return found
+
+
+@_unit_of_work
+async def insert_medication_requests(
+        db: AsyncSession,
+        items: Sequence[tuple[int, MedicationRequestInput]]
+) -> list[MedicationRequest | ResourceNotFoundError]:
+    """Insert (patient_id, input) items, without committing.
+
+    The patient, clinician and medication ids are checked with one query
+    per entity type, and the valid items are inserted in one multi-row
+    statement. The result for each item, in order, is either the new
+    MedicationRequest or the error for its first missing reference.
+    """
+    patient_ids = await existing_ids(db, (x[0] for x in items), Patient)
+    clinician_ids = await existing_ids(
+        db, (x[1].clinician_id for x in items), Clinician)
+    medication_ids = await existing_ids(
+        db, (x[1].medication_id for x in items), Medication)
+    errors: list[ResourceNotFoundError | None] = []
+    values = []
+    for patient_id, medication_request_input in items:
+        error = None
+        if patient_id not in patient_ids:
+            error = ResourceNotFoundError(Patient)
+        elif medication_request_input.clinician_id not in clinician_ids:
+            error = ResourceNotFoundError(Clinician)
+        elif medication_request_input.medication_id not in medication_ids:
+            error = ResourceNotFoundError(Medication)
+        else:
+            values.append(medication_request_input.model_dump()
+                          | {"patient_id": patient_id})
+        errors.append(error)
+    created: Iterator[MedicationRequest] = iter(())
+    if values:
+        table = MedicationRequest.__table__  # type: ignore
+        result = await db.execute(
+            insert(table).returning(*table.c, sort_by_parameter_order=True),
+            values)
+        created = iter([MedicationRequest(**row._asdict()) for row in result])
+    return [next(created) if error is None else error for error in errors]
+
+
+@_unit_of_work
+async def create_medication_requests(
+        db: AsyncSession,
+        medication_request_inputs: Sequence[MedicationRequestInput],
+        patient_id: int) -> list[MedicationRequest | ResourceNotFoundError]:
+    """Create many new MedicationRequests for a patient, in one transaction.
+
+    A missing patient is an error for the whole batch. Otherwise the
+    result for each input is the new MedicationRequest, or the error
+    for an input whose clinician or medication does not exist.
+    """
     async with db.begin():
         if not await id_exists(db, patient_id, Patient):
             raise ResourceNotFoundError(Patient)
-        if not await id_exists(db, medication_request_input.clinician_id,
-                               Clinician):
-            raise ResourceNotFoundError(Clinician)
-        if not await id_exists(db, medication_request_input.medication_id,
-                               Medication):
-            raise ResourceNotFoundError(Medication)
-
-        medication_request = MedicationRequest(
-            **medication_request_input.model_dump(), patient_id=patient_id)
-        db.add(medication_request)
+        results = await insert_medication_requests(
+            db, [(patient_id, x) for x in medication_request_inputs])
     await db.commit()
-    await db.refresh(medication_request)
-    return medication_request
+    record_write(patient_id)
+    return results
 
 
+@_unit_of_work
 async def update_medication_request(
         db: AsyncSession, patch_data: MedicationRequestPatch,
-        medication_request_id: int,
-        patient_id: int) -> MedicationRequest | None:
+        medication_request_id: int, patient_id: int,
+        versions: Collection[int] | None = None) -> MedicationRequestOutput:
     """Update a MedicationRequest in the database.
 
-    This can only change the fields in MedicationRequestPatch.
+    This can only change the fields in MedicationRequestPatch. If versions
+    is given, the update is only made if the current version is one of
+    them, else VersionConflictError is raised.
+
+    The update and the read back of the new values are one
+    UPDATE ... RETURNING statement; only if no row is updated is the
+    medication request read again, to find the reason.
+    """
+    statement = (
+        update(MedicationRequest)
+        .where(MedicationRequest.id == medication_request_id,  # type: ignore
+               MedicationRequest.patient_id == patient_id)  # type: ignore
+        .values(**patch_data.model_dump(),
+                version=MedicationRequest.version + 1)
+        .returning(*_OUTPUT_COLUMNS))
+    if versions is not None:
+        statement = statement.where(
+            MedicationRequest.version.in_(versions))  # type: ignore
+    async with db.begin():
+        row = (await db.execute(
+            statement,
+            execution_options={"synchronize_session": False})).first()
+        if row is None:
+            await _read_owned_medication_request(
+                db, medication_request_id, patient_id)
+            if versions is not None:
+                raise VersionConflictError()
+            raise ResourceNotFoundError(MedicationRequest)
+    await db.commit()
+    record_write(patient_id)
+    return (await _with_names(db, [row]))[0]
+
+
+def _date_range_criteria(date_range: MedicationRequestDateRange) -> list:
+    """Get the WHERE criteria for a prescribed date range filter."""
+    criteria = []
+    if date_range.filter_start_date:
+        criteria.append(MedicationRequest.prescribed_date
+                        >= date_range.filter_start_date)  # type: ignore
+    if date_range.filter_end_date:
+        criteria.append(MedicationRequest.prescribed_date
+                        <= date_range.filter_end_date)  # type: ignore
+    return criteria
+
+
+@_unit_of_work
+async def transition_medication_requests(
+        db: AsyncSession, transition: MedicationRequestTransition,
+        patient_id: int) -> list[int]:
+    """Change the status of all of a patient's matching MedicationRequests.
+
+    This is one UPDATE ... RETURNING statement, however many rows match.
+    Requests already in the new status are not changed. Each changed
+    request has its version incremented. The changed ids are returned.
     """
+    statement = (
+        update(MedicationRequest)
+        .where(MedicationRequest.patient_id == patient_id,  # type: ignore
+               MedicationRequest.status != transition.status,  # type: ignore
+               *_date_range_criteria(transition))
+        .values(status=transition.status,
+                version=MedicationRequest.version + 1)
+        .returning(MedicationRequest.id))  # type: ignore
+    if transition.from_statuses is not None:
+        statement = statement.where(
+            MedicationRequest.status.in_(  # type: ignore
+                transition.from_statuses))
     async with db.begin():
         if not await id_exists(db, patient_id, Patient):
             raise ResourceNotFoundError(Patient)
-        medication_request = await db.get(MedicationRequest,
-                                          medication_request_id)
-        if not medication_request:
-            raise ResourceNotFoundError(MedicationRequest)
-        if medication_request.patient_id != patient_id:
-            raise PatientIDMismatchError()
-        for key, value in patch_data.model_dump().items():
-            setattr(medication_request, key, value)
+        ids = sorted((await db.execute(
+            statement,
+            execution_options={"synchronize_session": False})).scalars())
     await db.commit()
-    await db.refresh(medication_request)
-    return medication_request
+    if ids:
+        record_write(patient_id)
+    return ids
+
 
+def _filtered_medication_requests_query(
+        patient_id: int, query_params: MedicationRequestQueryParams,
+        *columns, limit: bool = True) -> tuple[Any, dict[str, Any]]:
+    """Get the ordered query for filtered MedicationRequests.
 
+    This applies the filters, the cursor position and (optionally) the
+    limit. The whole MedicationRequest is selected unless columns are
+    given. The statement and its parameter values are returned.
+    """
+    if not columns:
+        columns = (MedicationRequest,)
+    cursor = query_params.position
+    statement = _filtered_statement(
+        columns, bool(query_params.status),
+        bool(query_params.filter_start_date),
+        bool(query_params.filter_end_date), cursor is not None, limit)
+    parameters = {"patient_id": patient_id, "status": query_params.status,
+                  "filter_start_date": query_params.filter_start_date,
+                  "filter_end_date": query_params.filter_end_date,
+                  "limit": query_params.limit + 1}
+    if cursor is not None:
+        parameters |= {"cursor_date": cursor.prescribed_date,
+                       "cursor_id": cursor.id}
+    return statement, parameters
+
+
+@functools.cache
+def _filtered_statement(  # pylint: disable=R0913,R0917
+        columns: tuple, status: bool, start_date: bool, end_date: bool,
+        cursor: bool, limit: bool):
+    """Build the statement for one shape of filtered MedicationRequests.
+
+    The shape is the selected columns and which of the optional filters,
+    the cursor position and the limit are used. The values are bound
+    parameters, so each shape is built (and compiled by SQLAlchemy) only
+    once. The limit parameter is one more than the page size, to find out
+    whether there is a next page.
+    """
+    query = select(*columns).where(
+        MedicationRequest.patient_id  # type: ignore
+        == bindparam("patient_id"))
+    if any(column is MedicationRequest for column in columns):
+        query = query.options(*_WITHOUT_REFERENCES)
+    if status:
+        query = query.where(
+            MedicationRequest.status == bindparam("status"))  # type: ignore
+    if start_date:
+        query = query.where(MedicationRequest.prescribed_date  # type: ignore
+                            >= bindparam("filter_start_date"))
+    if end_date:
+        query = query.where(MedicationRequest.prescribed_date  # type: ignore
+                            <= bindparam("filter_end_date"))
+    if cursor:
+        query = query.where(
+            tuple_(MedicationRequest.prescribed_date,  # type: ignore
+                   MedicationRequest.id)  # type: ignore
+            > tuple_(bindparam(
+                "cursor_date",
+                type_=MedicationRequest.prescribed_date.type),  # type: ignore
+                bindparam("cursor_id", type_=Integer)))
+    query = query.order_by(
+        MedicationRequest.prescribed_date,  # type: ignore
+        MedicationRequest.id)  # type: ignore
+    if limit:
+        query = query.limit(bindparam("limit", type_=Integer))
+    return query
+
+
+@_unit_of_work
 async def read_filtered_medication_requests(
         db: AsyncSession,
         patient_id: int,
-        query_params: MedicationRequestQueryParams) -> list[MedicationRequest]:
-    """Read filtered MedicationRequests from the database."""
+        query_params: MedicationRequestQueryParams
+) -> tuple[list[MedicationRequestOutput], str | None]:
+    """Read filtered MedicationRequests from the database.
+
+    The results are ordered by (prescribed_date, id). At most limit
+    results are returned, together with a cursor for the next page (or
+    None if there are no more results). Pages are found by keyset
+    comparison rather than by offset, so that every page costs the same
+    to read. Only the output columns are selected, as plain rows, so no
+    ORM objects are created.
+    """
+    if not await id_exists(db, patient_id, Patient):
+        raise ResourceNotFoundError(Patient)
+    # One extra row is read to find out whether there is a next page.
+    result = await db.execute(*_filtered_medication_requests_query(
+        patient_id, query_params, *_OUTPUT_COLUMNS))
+    medication_requests = result.all()
+    next_cursor = None
+    if len(medication_requests) > query_params.limit:
+        medication_requests = medication_requests[:query_params.limit]
+        last = medication_requests[-1]
+        next_cursor = MedicationRequestCursor(
+            prescribed_date=last.prescribed_date,
+            id=last.id).encode()  # type: ignore
+    return await _with_names(db, medication_requests), next_cursor
+
+
+@_unit_of_work
+async def read_filtered_medication_request_versions(
+        db: AsyncSession,
+        patient_id: int,
+        query_params: MedicationRequestQueryParams
+) -> tuple[list[tuple[int, int]], bool]:
+    """Read the (id, version) pairs of a page of MedicationRequests.
+
+    This selects the same page as read_filtered_medication_requests,
+    without loading the full rows, and also returns whether there is a
+    next page. The errors raised are the same.
+    """
+    if not await id_exists(db, patient_id, Patient):
+        raise ResourceNotFoundError(Patient)
+    rows = [(x[0], x[1]) for x in await db.execute(
+        *_filtered_medication_requests_query(
+            patient_id, query_params, MedicationRequest.id,
+            MedicationRequest.version))]
+    return rows[:query_params.limit], len(rows) > query_params.limit
+
+
+@_unit_of_work
+async def stream_filtered_medication_requests(
+        db: AsyncSession,
+        session_maker: async_sessionmaker[AsyncSession],
+        patient_id: int,
+        query_params: MedicationRequestQueryParams
+) -> AsyncIterator[MedicationRequestOutput]:
+    """Stream all filtered MedicationRequests from the database.
+
+    The ordering and filters are as for read_filtered_medication_requests
+    but the limit is ignored. The patient is checked with db before this
+    returns, so that an error is raised before a response is started.
+    The rows are then read lazily, using a server-side cursor in a new
+    session from session_maker, because db may be closed first. The
+    reference names are resolved for each batch of yield_per rows.
+    """
     if not await id_exists(db, patient_id, Patient):
         raise ResourceNotFoundError(Patient)
-    query = select(MedicationRequest).filter_by(patient_id=patient_id)
-    if query_params.status:
-        query = query.filter_by(status=query_params.status)
-    if query_params.filter_start_date:
-        query = query.filter(
-            MedicationRequest.prescribed_date
-            >= query_params.filter_start_date)  # type: ignore
-    if query_params.filter_end_date:
-        query = query.filter(
-            MedicationRequest.prescribed_date
-            <= query_params.filter_end_date)  # type: ignore
-    result = await db.execute(query)
-    return list(result.scalars().all())
+    return _stream_with_names(
+        session_maker, *_filtered_medication_requests_query(
+            patient_id, query_params, *_OUTPUT_COLUMNS, limit=False))
+
+
+async def _stream_with_names(
+        session_maker: async_sessionmaker[AsyncSession],
+        query, parameters: dict[str, Any]
+) -> AsyncIterator[MedicationRequestOutput]:
+    """Yield the output column rows of a query as output models."""
+    async with session_maker() as session:
+        result = await session.stream(
+            query, parameters,
+            execution_options={"yield_per": settings.STREAM_YIELD_PER})
+        async for partition in result.partitions():
+            for item in await _with_names(session, partition):
+                yield item
@@ -4,13 +4,20 @@ import os
 from typing import Annotated, AsyncGenerator, Any
 
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     create_async_engine,
     async_sessionmaker
 )
-from sqlalchemy import event
+from sqlalchemy import event, make_url
 from sqlmodel import SQLModel
-from fastapi import Depends
+from fastapi import Depends, Header
+
+from . import instrumentation
+from . import pool
+from . import replicas
+from . import sharding
+from . import settings
 
 # Examples:
 #
@@ -21,8 +28,77 @@ from fastapi import Depends
 # database_url = os.environ["DATABASE_URL"]
 
 
+def is_sqlite_file(database_url: str) -> bool:
+    """Check whether the URL is of an SQLite database file."""
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None, "", ":memory:")
+
+
+def pool_options(database_url: str, name: str,
+                 pool_size: int | None = None) -> dict[str, Any]:
+    """Get the engine arguments for an instrumented, configured pool.
+
+    If pool_size is given, the pool has exactly that many connections.
+    An in-memory SQLite database keeps its default single connection
+    pool, since each new connection would be a new empty database.
+    """
+    if (make_url(database_url).get_backend_name() == "sqlite"
+            and not is_sqlite_file(database_url)):
+        return {}
+    options = {"poolclass": pool.InstrumentedQueuePool,
+               "pool_logging_name": name,
+               "pool_size": settings.DATABASE_POOL_SIZE,
+               "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+               "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+               "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+               "pool_pre_ping": settings.DATABASE_POOL_PRE_PING}
+    if pool_size is not None:
+        options |= {"pool_size": pool_size, "max_overflow": 0}
+    return options
+
+
+def set_sqlite_pragmas(engine: AsyncEngine, read_only: bool = False) -> None:
+    """Configure each new connection of an SQLite engine.
+
+    The pragmas enforce foreign keys and set the WAL journal mode and
+    the caching and locking options. A read-only engine's connections
+    refuse to write.
+    """
+    pragmas = settings.SQLITE_PRAGMAS + (("query_only=ON",) if read_only
+                                         else ())
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(connection, _connection_record):
+        cursor = connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def connect_options(database_url: str) -> dict[str, Any]:
+    """Get the engine arguments for the database connections.
+
+    Each asyncpg connection keeps a cache of the statements it has
+    prepared, so that the server parses and plans each one only once.
+    """
+    if make_url(database_url).get_driver_name() == "asyncpg":
+        return {"connect_args": {"prepared_statement_cache_size":
+                                 settings.ASYNCPG_STATEMENT_CACHE_SIZE}}
+    return {}
+
+
 class Database:
-    """Non-instantiable class for database connection management."""
+    """Non-instantiable class for database connection management.
+
+    There is one engine and session maker for each shard. The first
+    shard, given by DATABASE_URL, is also the primary of any replicas.
+
+    An SQLite database file has two engines: writes use a single
+    connection, so they never wait for each other's locks, while reads
+    use a pool of read-only connections, which WAL mode lets run
+    alongside the writer.
+    """
 
     def __init__(self):
         raise RuntimeError("This class cannot be instantiated")
@@ -31,37 +107,136 @@ class Database:
     async def init_db(cls):
         """Create all database tables."""
         database_url = os.environ["DATABASE_URL"]
-        database_echo = bool(os.environ.get("DATABASE_ECHO", 1))
-        cls.engine = create_async_engine(database_url,
-                                         echo=database_echo)
-        cls._setup_event_listeners()
-        cls.async_sessionmaker = async_sessionmaker(
-            bind=cls.engine,
+        shard_urls = [("primary", database_url)] + [
+            (f"shard{number}", url)
+            for number, url in enumerate(settings.DATABASE_SHARD_URLS, 1)]
+        cls.shard_engines = []
+        cls.shards = []
+        cls.read_shards = []
+        for name, url in shard_urls:
+            sqlite_file = is_sqlite_file(url)
+            engine = cls._create_engine(name, url,
+                                        1 if sqlite_file else None)
+            read_engine = engine
+            if sqlite_file:
+                read_engine = cls._create_engine(
+                    f"{name}-read", url, settings.SQLITE_READER_POOL_SIZE,
+                    read_only=True)
+            cls.shard_engines.append(engine)
+            cls.shards.append(cls._session_maker(engine))
+            cls.read_shards.append(cls._session_maker(read_engine))
+        cls.engine = cls.shard_engines[0]
+        cls.async_sessionmaker = cls.shards[0]
+        cls.replicas = replicas.ReplicaSet(
+            [cls._create_replica(f"replica{number}", url)
+             for number, url in enumerate(settings.DATABASE_REPLICA_URLS, 1)])
+        await cls.replicas.check_health()
+
+    @classmethod
+    async def close_db(cls):
+        """Close all the database connections."""
+        engines = {session_maker.kw["bind"] for session_maker in
+                   cls.shards + cls.read_shards}  # type: ignore
+        engines.update(replica.engine for replica in
+                       cls.replicas.replicas)  # type: ignore
+        for engine in engines:
+            await engine.dispose()
+
+    @classmethod
+    def _create_engine(cls, name: str, url: str,
+                       pool_size: int | None = None,
+                       read_only: bool = False) -> AsyncEngine:
+        engine = create_async_engine(url, echo=settings.DATABASE_ECHO,
+                                     **pool_options(url, name, pool_size),
+                                     **connect_options(url))
+        pool.watch(name, engine)
+        instrumentation.instrument(engine)
+        if engine.dialect.name == "sqlite":
+            set_sqlite_pragmas(engine, read_only)
+        return engine
+
+    @classmethod
+    def _session_maker(
+            cls, engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
+            bind=engine,
             expire_on_commit=False,
             autocommit=False
         )
 
+    @classmethod
+    def _create_replica(cls, name: str, url: str) -> replicas.Replica:
+        replica = replicas.Replica(name, cls._create_engine(name, url))
+        replicas.watch(replica)
+        return replica
+
     @classmethod
     async def create_all(cls):
-        """Call SQLModel to create the database tables."""
-        async with cls.engine.begin() as conn:
-            await conn.run_sync(SQLModel.metadata.create_all)
+        """Call SQLModel to create the database tables in every shard."""
+        for engine in cls.shard_engines:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+
+    @classmethod
+    async def shard_for(cls, patient_id: int) -> int:
+        """Get the number of the shard holding a patient's data."""
+        shard_count = len(cls.shards)  # type: ignore
+        if shard_count == 1:
+            return 0
+        async with cls.read_shards[0]() as db:  # type: ignore
+            return await sharding.read_shard(db, patient_id, shard_count)
 
     @classmethod
-    def _setup_event_listeners(cls):
-        @event.listens_for(cls.engine.sync_engine, "connect")
-        def _enable_foreign_keys(connection, _connection_record):
-            """Make SQLite enforce foreign keys; ignored for PostgreSQL."""
-            try:
-                connection.execute("PRAGMA foreign_keys=ON")
-            except Exception:  # pylint: disable=W0718
-                print("Foreign key constraint enabling not applicable")
+    async def session_maker_for(
+            cls, patient_id: int) -> async_sessionmaker[AsyncSession]:
+        """Get the session maker of the shard holding a patient's data."""
+        return cls.shards[await cls.shard_for(patient_id)]  # type: ignore
 
     @classmethod
-    async def get_db(cls) -> AsyncGenerator[AsyncSession, Any]:
-        """Create a new context-managed database session."""
-        async with cls.async_sessionmaker() as session:  # type: ignore
+    async def read_session_maker_for(
+            cls, patient_id: int) -> async_sessionmaker[AsyncSession]:
+        """Get the read session maker of a patient's shard.
+
+        For an SQLite file this uses the read-only connections, so that
+        a long read (e.g. a slow streaming client) does not hold the
+        single writer connection.
+        """
+        return cls.read_shards[await cls.shard_for(patient_id)]  # type: ignore
+
+    @classmethod
+    async def get_db(cls,
+                     patient_id: int) -> AsyncGenerator[AsyncSession, Any]:
+        """Create a session on the shard holding a patient's data.
+
+        The session only holds a connection from its first statement
+        until the end of its transaction, which each crud function ends
+        when it returns, and not for the rest of the request.
+        """
+        async with (await cls.session_maker_for(patient_id))() as session:
+            yield session
+
+    @classmethod
+    async def get_read_db(
+            cls, patient_id: int,
+            read_primary: Annotated[str | None, Header(
+                alias=settings.READ_PRIMARY_HEADER)] = None
+    ) -> AsyncGenerator[AsyncSession, Any]:
+        """Create a session for reading a patient's data.
+
+        On the first shard, the session uses a healthy replica, if any,
+        unless the request has the read-primary header or the patient
+        was written recently. Otherwise it uses the shard's readers.
+        """
+        shard = await cls.shard_for(patient_id)
+        session_maker = None
+        if shard == 0:
+            session_maker = cls.replicas.choose(  # type: ignore
+                patient_id, read_primary is not None)
+        if session_maker is None:
+            session_maker = cls.read_shards[shard]  # type: ignore
+        async with session_maker() as session:
             yield session
 
 
 DbDependency = Annotated[AsyncSession, Depends(Database.get_db)]
+ReadDbDependency = Annotated[AsyncSession, Depends(Database.get_read_db)]
@@ -0,0 +1,54 @@
+"""Entity tags for conditional requests."""
+
+import hashlib
+
+from .models.medication_request import MedicationRequestQueryParams
+
+
+def version_etag(version: int) -> str:
+    """Make the strong ETag for a single resource version."""
+    return f'"{version}"'
+
+
+def collection_etag(query_params: MedicationRequestQueryParams,
+                    versions: list[tuple[int, int]], has_next: bool) -> str:
+    """Make the strong ETag for a page of a collection.
+
+    This depends on the query and the (id, version) pair of every item
+    in the page, so any change to the page content changes the tag.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(query_params.model_dump_json().encode())
+    digest.update(repr((versions, has_next)).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_etags(header: str) -> list[str]:
+    """Get the list of tags in an If-Match or If-None-Match header."""
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(if_none_match: str | None, etag: str) -> bool:
+    """Check whether an If-None-Match header allows a full response.
+
+    Weak comparison is used, as required for If-None-Match.
+    """
+    if if_none_match is None:
+        return True
+    tags = parse_etags(if_none_match)
+    return not ("*" in tags or etag in [tag.removeprefix("W/")
+                                        for tag in tags])
+
+
+def if_match_versions(if_match: str) -> list[int] | None:
+    """Get the resource versions allowed by an If-Match header.
+
+    None means any version ("*"). Strong comparison is used, as required
+    for If-Match, so weak tags and tags of other forms match nothing.
+    """
+    tags = parse_etags(if_match)
+    if "*" in tags:
+        return None
+    return [int(tag[1:-1]) for tag in tags
+            if len(tag) > 2 and tag[0] == tag[-1] == '"'
+            and tag[1:-1].isdigit()]
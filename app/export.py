@@ -0,0 +1,127 @@
+"""Streaming export of medication requests as JSON Lines or CSV.
+
+Each row has the medication request columns plus the medication code
+name and the clinician names. Rows are read in chunks ordered by id,
+each chunk in its own short transaction, continuing after the last id
+of the previous chunk. Memory use is bounded by the chunk size, and no
+transaction is held open while the output is consumed, so an export
+does not block writers, however slow the client.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from enum import Enum
+from typing import Any, AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import settings
+from .models.clinician import Clinician
+from .models.medication import Medication
+from .models.medication_request import MedicationRequest
+
+FORMATS = ("jsonl", "csv")
+
+# The medicationrequest columns, with the ids first.
+_REQUEST_COLUMNS = tuple(sorted(
+    MedicationRequest.__table__.c,  # type: ignore
+    key=lambda column: column.name not in ("id", "patient_id")))
+
+# The columns of each exported row, in order.
+COLUMNS: tuple[str, ...] = (
+    tuple(column.name for column in _REQUEST_COLUMNS)
+    + ("medication_code_name", "clinician_first_name",
+       "clinician_last_name"))
+
+_ID_INDEX = COLUMNS.index("id")
+
+
+async def export_rows(
+        session_maker: async_sessionmaker[AsyncSession],
+        patient_id: int | None = None,
+        chunk_size: int = settings.EXPORT_CHUNK_SIZE
+) -> AsyncIterator[list[tuple]]:
+    """Yield chunks of the rows for one patient, or for all patients."""
+    query = (
+        select(*_REQUEST_COLUMNS, Medication.code_name,  # type: ignore
+               Clinician.first_name, Clinician.last_name)  # type: ignore
+        .join(MedicationRequest.medication)  # type: ignore
+        .join(MedicationRequest.clinician)  # type: ignore
+        .order_by(MedicationRequest.id)  # type: ignore
+        .limit(chunk_size))
+    if patient_id is not None:
+        query = query.where(
+            MedicationRequest.patient_id == patient_id)  # type: ignore
+    last_id = None
+    while True:
+        chunk_query = query
+        if last_id is not None:
+            chunk_query = query.where(
+                MedicationRequest.id > last_id)  # type: ignore
+        async with session_maker() as db:
+            rows = [tuple(row) for row in await db.execute(chunk_query)]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][_ID_INDEX]
+
+
+def _plain(value: Any) -> Any:
+    """Convert a column value to a JSON or CSV value."""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def encode_jsonl(rows: list[tuple]) -> bytes:
+    """Encode rows as JSON Lines."""
+    return "".join(
+        json.dumps(dict(zip(COLUMNS, map(_plain, row)))) + "\n"
+        for row in rows).encode()
+
+
+def encode_csv(rows: list[tuple], header: bool = False) -> bytes:
+    """Encode rows as CSV, optionally preceded by the header row."""
+    text = io.StringIO()
+    writer = csv.writer(text)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows([_plain(value) for value in row] for row in rows)
+    return text.getvalue().encode()
+
+
+async def export_bytes(
+        session_maker: async_sessionmaker[AsyncSession],
+        patient_id: int | None = None, output_format: str = "jsonl",
+        compress: bool = False,
+        chunk_size: int = settings.EXPORT_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export, one chunk of rows at a time.
+
+    If compress is True, the output is one gzip stream.
+    """
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    first = True
+    async for rows in export_rows(session_maker, patient_id, chunk_size):
+        if output_format == "csv":
+            data = encode_csv(rows, header=first)
+        else:
+            data = encode_jsonl(rows)
+        first = False
+        if gzip is not None:
+            data = gzip.compress(data)
+        if data:
+            yield data
+    if first and output_format == "csv":  # no rows: send only the header
+        data = encode_csv([], header=True)
+        yield gzip.compress(data) if gzip is not None else data
+    if gzip is not None:
+        yield gzip.flush()
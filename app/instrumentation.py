@@ -0,0 +1,125 @@
+"""Per-request SQL statement counts and timings.
+
+SQLAlchemy cursor events time every statement. The statement count and
+total database time are added up for the HTTP request being handled,
+found through a context variable, and recorded per route in histograms,
+which makes routes with many round trips easy to find. The SQL
+compilation cache hits and misses are counted. Statements slower than
+a threshold are logged. Optionally, the request totals are
+sent in a Server-Timing response header.
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+statement_seconds = registry.histogram(
+    "db_statement_seconds", "Time to execute one SQL statement")
+request_statements = registry.histogram(
+    "http_request_db_statements", "SQL statements executed per request",
+    "route", buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+request_db_seconds = registry.histogram(
+    "http_request_db_seconds", "Total SQL statement time per request",
+    "route")
+
+# Statements executed, by whether their compiled form was found in the
+# SQLAlchemy statement cache (e.g. cache_hit, cache_miss).
+_compiled_cache: dict[str, int] = {}
+registry.counter("db_compiled_cache_total",
+                 "Statements executed, by SQL compilation cache result",
+                 lambda: dict(_compiled_cache), "result")
+
+
+@dataclass
+class QueryStats:
+    """Statement count and total execution time (s)."""
+
+    count: int = 0
+    seconds: float = 0.0
+
+    def server_timing(self) -> str:
+        """Get the Server-Timing header value."""
+        return (f'db;dur={self.seconds * 1000:.1f};'
+                f'desc="{self.count} statements"')
+
+
+_request_stats: ContextVar[QueryStats | None] = ContextVar(
+    "request_stats", default=None)
+
+
+def instrument(engine: AsyncEngine) -> None:
+    """Time every statement executed by the engine."""
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute",
+                 _after_cursor_execute)
+
+
+def _before_cursor_execute(_conn, _cursor, _statement, _parameters,
+                           context, _executemany):
+    # Kept on the statement's execution context rather than the pooled
+    # connection, so nothing is left behind when a statement fails.
+    context.statement_start = time.perf_counter()
+
+
+def _after_cursor_execute(_conn, _cursor, statement, _parameters,
+                          context, _executemany):
+    elapsed = time.perf_counter() - context.statement_start
+    statement_seconds.observe(elapsed)
+    cache_result = getattr(context, "cache_hit", None)
+    if cache_result is not None:
+        _compiled_cache[cache_result.name.lower()] = (
+            _compiled_cache.get(cache_result.name.lower(), 0) + 1)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+    if elapsed >= settings.SLOW_QUERY_SECONDS:
+        logger.warning("Slow SQL statement (%.3f s): %s", elapsed,
+                       " ".join(statement.split())[:1000])
+
+
+class QueryStatsMiddleware:  # pylint: disable=R0903
+    """ASGI middleware recording the SQL statements of each request.
+
+    Statements executed after the response headers are sent, e.g. by a
+    streaming response, are counted in the metrics but not the header.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        """Handle one ASGI connection."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_timing(message):
+            if (self.server_timing
+                    and message["type"] == "http.response.start"):
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"server-timing", stats.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            request_statements.observe(stats.count, path)
+            request_db_seconds.observe(stats.seconds, path)
@@ -1,22 +1,57 @@
 """Create and configure the FastAPI app."""
 
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.exc import SQLAlchemyError
 
 from . import settings
 from .routers import patient
 from . import database
 from . import crud
+from . import coalescer
+from . import metrics
+from . import instrumentation
 from .models import types
 
+logger = logging.getLogger(__name__)
+
+
+async def delete_expired_idempotency_keys():
+    """Periodically delete the expired idempotency keys."""
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS)
+        try:
+            for session_maker in database.Database.shards:  # type: ignore
+                async with session_maker() as db:
+                    await crud.delete_expired_idempotency_keys(db)
+        except SQLAlchemyError:
+            logger.exception("Failed to delete expired idempotency keys")
+
 
 @asynccontextmanager
 async def lifespan_events(_app: FastAPI):
     """Run tasks at start and end of app lifespan."""
     await database.Database.init_db()
+    cleanup_task = asyncio.create_task(delete_expired_idempotency_keys())
+    replica_task = asyncio.create_task(
+        database.Database.replicas.run_health_checks())  # type: ignore
+    if settings.WRITE_COALESCER:
+        coalescer.writers = [
+            coalescer.WriteCoalescer(
+                session_maker, settings.WRITE_COALESCER_WINDOW_SECONDS,
+                settings.WRITE_COALESCER_MAX_BATCH_SIZE)
+            for session_maker in database.Database.shards]  # type: ignore
     yield
+    for writer in coalescer.writers:
+        await writer.close()
+    coalescer.writers = []
+    cleanup_task.cancel()
+    replica_task.cancel()
+    await database.Database.close_db()
 
 
 app = FastAPI(
@@ -34,6 +69,9 @@ app = FastAPI(
     lifespan=lifespan_events
 )
 
+app.add_middleware(instrumentation.QueryStatsMiddleware,
+                   server_timing=settings.SERVER_TIMING)
+
 
 app.include_router(
     patient.router,
@@ -41,6 +79,13 @@ app.include_router(
 )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Get the application metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(),
+                             media_type=settings.METRICS_MEDIA_TYPE)
+
+
 @app.exception_handler(crud.ResourceNotFoundError)
 async def not_found_handler(_request, exc: crud.ResourceNotFoundError):
     """Raise HTTP error for entity resource not found."""
@@ -59,6 +104,26 @@ async def id_mismatch_handler(_request, exc: crud.PatientIDMismatchError):
     )
 
 
+@app.exception_handler(crud.VersionConflictError)
+async def version_conflict_handler(_request,
+                                   exc: crud.VersionConflictError):
+    """Raise HTTP error for a failed If-Match precondition."""
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={"detail": exc.message},
+    )
+
+
+@app.exception_handler(crud.IdempotencyKeyReuseError)
+async def idempotency_key_reuse_handler(
+        _request, exc: crud.IdempotencyKeyReuseError):
+    """Raise HTTP error for an idempotency key reused with new content."""
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": exc.message},
+    )
+
+
 @app.exception_handler(types.ModelInvalidError)
 async def failed_validator_handler(_request, exc: types.ModelInvalidError):
     """Raise HTTP error for failing model validator."""
@@ -0,0 +1,115 @@
+"""Application metrics, published in the Prometheus text format.
+
+Gauges and counters are read from callbacks when the metrics are
+rendered, so the measured code only keeps its own plain counts. A
+callback returns one value, or a value for each label value. Latencies
+are recorded in histograms with fixed buckets.
+"""
+
+import bisect
+from typing import Callable
+
+# A callback result: one value, or a value for each label value.
+Sample = float | dict[str, float]
+
+# Histogram bucket upper bounds (s) suitable for database latencies.
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Distribution of observed values, optionally for each label value."""
+
+    def __init__(self, name: str, description: str, label: str | None = None,
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._counts: dict[str, list[int]] = {}
+        self._sums: dict[str, float] = {}
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        """Record one value."""
+        counts = self._counts.setdefault(
+            label_value, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[label_value] = self._sums.get(label_value, 0.0) + value
+
+    def count(self, label_value: str = "") -> int:
+        """Get the number of values recorded."""
+        return sum(self._counts.get(label_value, ()))
+
+    def clear(self) -> None:
+        """Forget all recorded values."""
+        self._counts.clear()
+        self._sums.clear()
+
+    def render(self) -> list[str]:
+        """Get the lines of the text format."""
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} histogram"]
+        for label_value, counts in sorted(self._counts.items()):
+            labels = (f'{self.label}="{label_value}",'
+                      if self.label is not None else "")
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                bound_text = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound_text}"}}'
+                             f' {total}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {self._sums[label_value]}")
+            lines.append(f"{self.name}_count{suffix} {total}")
+        return lines
+
+
+class Registry:
+    """The set of published metrics."""
+
+    def __init__(self) -> None:
+        self._callbacks: dict[
+            str, tuple[str, str, str | None, Callable[[], Sample]]] = {}
+        self._histograms: dict[str, Histogram] = {}
+
+    def gauge(self, name: str, description: str,
+              callback: Callable[[], Sample], label: str | None = None,
+              metric_type: str = "gauge") -> None:
+        """Publish the value returned by callback (e.g. a size)."""
+        self._callbacks[name] = (description, metric_type, label, callback)
+
+    def counter(self, name: str, description: str,
+                callback: Callable[[], Sample],
+                label: str | None = None) -> None:
+        """Publish the total returned by callback (e.g. a hit count)."""
+        self.gauge(name, description, callback, label, "counter")
+
+    def histogram(self, name: str, description: str,
+                  label: str | None = None,
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Get the histogram with this name, creating it if necessary."""
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, description, label,
+                                               buckets)
+        return self._histograms[name]
+
+    def render(self) -> str:
+        """Get all the metrics in the text format."""
+        lines = []
+        for name, (description, metric_type, label, callback) in sorted(
+                self._callbacks.items()):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            sample = callback()
+            if isinstance(sample, dict):
+                for label_value, value in sorted(sample.items()):
+                    lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+            else:
+                lines.append(f"{name} {sample}")
+        for histogram in self._histograms.values():
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
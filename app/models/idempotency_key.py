@@ -0,0 +1,24 @@
+"""SQLModels for the idempotency keys of POST requests."""
+
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, TEXT
+
+from .. import settings
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """A POST request already made with an Idempotency-Key header.
+
+    This stores what is needed to replay the original response. The
+    fingerprint identifies the request content, so that reuse of a key
+    for a different request can be detected.
+    """
+
+    key: str = Field(primary_key=True,
+                     max_length=settings.IDEMPOTENCY_KEY_MAX_LENGTH)
+    fingerprint: str
+    medication_request_id: int
+    response_body: str = Field(sa_column=Column(TEXT, nullable=False))
+    created_at: datetime = Field(index=True)
@@ -1,14 +1,15 @@
 """SQLModels for the MedicationRequest entity."""
 
+import base64
 from datetime import date
 from typing import Annotated
 from typing_extensions import Self
 
 from sqlmodel import Field, SQLModel, Relationship
 from sqlalchemy.dialects.postgresql import TEXT
-from sqlalchemy import Column, Enum
+from sqlalchemy import Column, Enum, Index
 from pydantic.functional_validators import BeforeValidator
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, PrivateAttr, model_validator
 
 from .types import MedicationRequestStatus, ModelInvalidError
 from .. import settings
@@ -55,15 +56,28 @@ class MedicationRequestInput(MedicationRequestBase):
     for existence in the database.
     """
 
-    clinician_id: int = Field(foreign_key="clinician.id")
-    medication_id: int = Field(foreign_key="medication.id")
+    clinician_id: int = Field(foreign_key="clinician.id", index=True)
+    medication_id: int = Field(foreign_key="medication.id", index=True)
 
 
 class MedicationRequest(MedicationRequestInput, table=True):
     """MedicationRequest database model class."""
 
+    # Composite indexes matching the patient-scoped collection queries,
+    # which filter by patient (and optionally status) and then order by
+    # (prescribed_date, id). These also serve as the patient_id foreign
+    # key index.
+    __table_args__ = (
+        Index("ix_medicationrequest_patient_id_prescribed_date_id",
+              "patient_id", "prescribed_date", "id"),
+        Index("ix_medicationrequest_patient_id_status_prescribed_date_id",
+              "patient_id", "status", "prescribed_date", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     patient_id: int = Field(foreign_key="patient.id")
+    # Incremented by every update; used for ETags and concurrency control.
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     medication: Medication = Relationship(
         back_populates="medication_requests",
         sa_relationship_kwargs={'lazy': 'joined'})
@@ -76,15 +90,50 @@ class MedicationRequestOutput(MedicationRequestInput):
     """MedicationRequest class for output serialisation in responses."""
 
     id: int
+    version: int
     medication: MedicationCodeName
     clinician: ClinicianName
 
 
-class MedicationRequestQueryParams(BaseModel):
-    """Query parameters for the GET filtering."""
+class MedicationRequestBulkResult(BaseModel):
+    """Result of creating one item of a bulk request.
+
+    This has the new medication request (status 201) or the reason that
+    it could not be created.
+    """
+
+    status_code: int
+    medication_request: MedicationRequest | None = None
+    detail: str | None = None
+
+
+class MedicationRequestCursor(BaseModel):
+    """Position in the (prescribed_date, id) ordering of a collection.
+
+    This is exchanged with clients as an opaque URL-safe string.
+    """
+
+    prescribed_date: date
+    id: int
+
+    def encode(self) -> str:
+        """Convert to the opaque string form."""
+        return base64.urlsafe_b64encode(
+            self.model_dump_json().encode()).decode()
+
+    @classmethod
+    def decode(cls, cursor: str) -> Self:
+        """Convert from the opaque string form."""
+        try:
+            return cls.model_validate_json(
+                base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError as exc:
+            raise ModelInvalidError('Invalid cursor.') from exc
+
+
+class MedicationRequestDateRange(BaseModel):
+    """Optional filter on the prescribed date, inclusive at both ends."""
 
-    status: Annotated[MedicationRequestStatus | None,
-                      BeforeValidator(lambda v: v.lower() if v else v)] = None
     filter_start_date: date | None = None
     filter_end_date: date | None = None
 
@@ -94,3 +143,50 @@ class MedicationRequestQueryParams(BaseModel):
         if (self.filter_start_date is None) != (self.filter_end_date is None):
             raise ModelInvalidError('Invalid date range.')
         return self
+
+
+class MedicationRequestQueryParams(MedicationRequestDateRange):
+    """Query parameters for the GET filtering and paging.
+
+    The cursor is the opaque string returned with the previous page; it
+    is decoded once, during validation, into the position property.
+    """
+
+    status: Annotated[MedicationRequestStatus | None,
+                      BeforeValidator(lambda v: v.lower() if v else v)] = None
+    limit: int = Field(
+        default=settings.MEDICATION_REQUESTS_DEFAULT_LIMIT,
+        ge=1, le=settings.MEDICATION_REQUESTS_MAX_LIMIT)
+    cursor: str | None = None
+    _position: MedicationRequestCursor | None = PrivateAttr(default=None)
+
+    @model_validator(mode='after')
+    def validate_cursor(self) -> Self:
+        """Require the cursor to be decodable (unless None)."""
+        if self.cursor is not None:
+            self._position = MedicationRequestCursor.decode(self.cursor)
+        return self
+
+    @property
+    def position(self) -> MedicationRequestCursor | None:
+        """Get the decoded cursor: results start after this position."""
+        return self._position
+
+
+class MedicationRequestTransition(MedicationRequestDateRange):
+    """Status change for all of a patient's matching medication requests.
+
+    Requests are matched by the date range and by their current status,
+    which must be one of from_statuses if this is given.
+    """
+
+    from_statuses: list[MedicationRequestStatus] | None = Field(
+        default=None, min_length=1)
+    status: MedicationRequestStatus
+
+
+class MedicationRequestTransitionResult(BaseModel):
+    """The medication requests changed by a status transition."""
+
+    count: int
+    ids: list[int]
@@ -0,0 +1,15 @@
+"""SQLModel for the shard directory of patients."""
+
+from sqlmodel import Field, SQLModel
+
+
+class PatientShard(SQLModel, table=True):
+    """The shard holding a patient's data, if not the default shard.
+
+    The directory is kept in the first shard. A patient without an
+    entry is on the shard given by its id modulo the number of shards.
+    """
+
+    patient_id: int = Field(primary_key=True, sa_column_kwargs={
+        "autoincrement": False})
+    shard: int
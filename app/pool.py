@@ -0,0 +1,80 @@
+"""Connection pool with checkout metrics.
+
+The pool is the standard asyncio queue pool, with the time taken by
+each checkout (waiting for a free connection, or opening a new one)
+recorded in a histogram, and checkout timeouts counted. For the engines
+passed to watch(), the time each connection is held (from checkout to
+checkin) is recorded, and the size, checked-out and overflow gauges are
+read from their pools. Each pool is labelled by its logging name.
+"""
+
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .metrics import registry
+
+checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time to check out a database connection from the pool", "pool")
+hold_seconds = registry.histogram(
+    "db_pool_connection_hold_seconds",
+    "Time a database connection is checked out of the pool", "pool")
+
+_engines: dict[str, AsyncEngine] = {}
+_timeouts: dict[str, int] = {}
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool which records the time taken by each checkout."""
+
+    def _do_get(self):
+        name = self._orig_logging_name or ""
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            _timeouts[name] = _timeouts.get(name, 0) + 1
+            raise
+        finally:
+            checkout_seconds.observe(time.perf_counter() - start, name)
+
+
+def watch(name: str, engine: AsyncEngine) -> None:
+    """Publish the pool gauges of an engine, under the name."""
+    _engines[name] = engine
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _checkout(_dbapi_connection, connection_record, _connection_proxy):
+        connection_record.info["checkout_time"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _checkin(_dbapi_connection, connection_record):
+        start = connection_record.info.pop("checkout_time", None)
+        if start is not None:
+            hold_seconds.observe(time.perf_counter() - start, name)
+
+
+def _pool_gauge(method: str):
+    """Make a callback reading a QueuePool method of every watched pool."""
+    def callback() -> dict[str, float]:
+        return {name: getattr(engine.pool, method)()
+                for name, engine in _engines.items()
+                if isinstance(engine.pool, AsyncAdaptedQueuePool)}
+    return callback
+
+
+registry.gauge("db_pool_size", "Configured number of pooled connections",
+               _pool_gauge("size"), "pool")
+registry.gauge("db_pool_checked_out", "Connections currently checked out",
+               _pool_gauge("checkedout"), "pool")
+registry.gauge("db_pool_checked_in", "Idle connections in the pool",
+               _pool_gauge("checkedin"), "pool")
+registry.gauge("db_pool_overflow",
+               "Connections open beyond the pool size (negative if fewer "
+               "than the pool size are open)", _pool_gauge("overflow"), "pool")
+registry.counter("db_pool_checkout_timeouts_total",
+                 "Checkouts which timed out waiting for a connection",
+                 lambda: dict(_timeouts), "pool")
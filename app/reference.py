@@ -0,0 +1,108 @@
+"""Read-through cache of Medication and Clinician reference data.
+
+Medication request responses only need the medication code name and the
+clinician names. These rarely change, so they are cached in-process by
+id rather than joined into every medication request query.
+"""
+
+from typing import Iterable
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import LRUCache
+from .metrics import registry
+from .models.clinician import Clinician, ClinicianName
+from .models.medication import Medication, MedicationCodeName
+from . import settings
+
+medication_names: LRUCache[int, MedicationCodeName] = LRUCache(
+    settings.REFERENCE_CACHE_MAX_SIZE, settings.REFERENCE_CACHE_TTL_SECONDS)
+clinician_names: LRUCache[int, ClinicianName] = LRUCache(
+    settings.REFERENCE_CACHE_MAX_SIZE, settings.REFERENCE_CACHE_TTL_SECONDS)
+
+
+async def resolve_names(
+        db: AsyncSession, medication_ids: Iterable[int],
+        clinician_ids: Iterable[int]
+) -> tuple[dict[int, MedicationCodeName], dict[int, ClinicianName]]:
+    """Get the names for the ids, reading any cache misses together."""
+    medications: dict[int, MedicationCodeName] = {}
+    missing_medication_ids = _lookup(medication_names, medication_ids,
+                                     medications)
+    if missing_medication_ids:
+        result = await db.execute(
+            select(Medication.id, Medication.code_name).where(  # type: ignore
+                Medication.id.in_(missing_medication_ids)))  # type: ignore
+        for medication_id, code_name in result:
+            medications[medication_id] = MedicationCodeName(
+                code_name=code_name)
+            medication_names.put(medication_id, medications[medication_id])
+
+    clinicians: dict[int, ClinicianName] = {}
+    missing_clinician_ids = _lookup(clinician_names, clinician_ids,
+                                    clinicians)
+    if missing_clinician_ids:
+        result = await db.execute(
+            select(Clinician.id, Clinician.first_name,  # type: ignore
+                   Clinician.last_name).where(  # type: ignore
+                Clinician.id.in_(missing_clinician_ids)))  # type: ignore
+        for clinician_id, first_name, last_name in result:
+            clinicians[clinician_id] = ClinicianName(
+                first_name=first_name, last_name=last_name)
+            clinician_names.put(clinician_id, clinicians[clinician_id])
+    return medications, clinicians
+
+
+def _lookup(cache: LRUCache, ids: Iterable[int], found: dict) -> set[int]:
+    """Add the cached values for ids to found; return the missing ids."""
+    missing = set()
+    for object_id in set(ids):
+        value = cache.get(object_id)
+        if value is None:
+            missing.add(object_id)
+        else:
+            found[object_id] = value
+    return missing
+
+
+def invalidate_medication(medication_id: int) -> None:
+    """Remove a Medication from the cache, e.g. after it changes."""
+    medication_names.invalidate(medication_id)
+
+
+def invalidate_clinician(clinician_id: int) -> None:
+    """Remove a Clinician from the cache, e.g. after it changes."""
+    clinician_names.invalidate(clinician_id)
+
+
+def stats() -> dict[str, dict[str, int]]:
+    """Get the reference cache sizes and hit/miss counts."""
+    return {"medication": medication_names.stats(),
+            "clinician": clinician_names.stats()}
+
+
+registry.gauge("reference_cache_size", "Cached reference names",
+               lambda: {k: v["size"] for k, v in stats().items()}, "cache")
+registry.counter("reference_cache_hits_total", "Reference name cache hits",
+                 lambda: {k: v["hits"] for k, v in stats().items()}, "cache")
+registry.counter("reference_cache_misses_total",
+                 "Reference name cache misses",
+                 lambda: {k: v["misses"] for k, v in stats().items()},
+                 "cache")
+
+
+@event.listens_for(Medication, "after_update")
+@event.listens_for(Medication, "after_delete")
+def _medication_changed(_mapper, _connection, target: Medication):
+    """Invalidate a Medication changed through the ORM."""
+    if target.id is not None:
+        invalidate_medication(target.id)
+
+
+@event.listens_for(Clinician, "after_update")
+@event.listens_for(Clinician, "after_delete")
+def _clinician_changed(_mapper, _connection, target: Clinician):
+    """Invalidate a Clinician changed through the ORM."""
+    if target.id is not None:
+        invalidate_clinician(target.id)
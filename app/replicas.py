@@ -0,0 +1,156 @@
+"""Read replica selection and health checks.
+
+Read-only routes can use a session on one of the replicas, chosen in
+turn (round robin) from those which passed their last health check. A
+replica is healthy if it answers within the check timeout and its
+replication lag is within the limit; otherwise it is skipped until a
+later check passes. If no replica is healthy, the primary is used.
+
+A patient's reads go to the primary for a short time after a write to
+that patient, so that a client reads its own writes despite the lag.
+The recent writes are only known to the process which made them, so
+clients of a multi-process deployment can also ask for the primary
+with a request header.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker
+)
+
+from . import settings
+from .cache import LRUCache
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Replication lag (s) of a PostgreSQL standby: zero if it has replayed
+# all the WAL it has received (so an idle primary does not look like
+# lag), or if it is not a standby.
+_POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery()"
+    " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+    " END")
+
+# Patients written recently by this process, whose reads use the primary.
+recent_writes: LRUCache[int, bool] = LRUCache(
+    settings.READ_YOUR_WRITES_MAX_PATIENTS,
+    settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def record_write(patient_id: int) -> None:
+    """Send the patient's reads to the primary for the sticky window."""
+    recent_writes.put(patient_id, True)
+
+
+@dataclass
+class Replica:
+    """A read replica and the result of its last health check."""
+
+    name: str
+    engine: AsyncEngine
+    session_maker: async_sessionmaker[AsyncSession] = field(init=False)
+    healthy: bool = False
+    lag_seconds: float | None = None
+
+    def __post_init__(self):
+        """Make the session maker."""
+        self.session_maker = async_sessionmaker(
+            bind=self.engine, expire_on_commit=False, autocommit=False)
+
+    async def read_lag(self) -> float:
+        """Get the replication lag (s), or zero if it is unknown."""
+        async with self.engine.connect() as conn:
+            if self.engine.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            return float((await conn.execute(_POSTGRES_LAG)).scalar() or 0)
+
+
+class ReplicaSet:
+    """The replicas used in turn for reads."""
+
+    def __init__(self, replicas: list[Replica]):
+        self.replicas = replicas
+        self._next = 0
+
+    def choose(self, patient_id: int | None = None,
+               read_primary: bool = False
+               ) -> async_sessionmaker[AsyncSession] | None:
+        """Get the next healthy replica's session maker.
+
+        None, meaning the primary, is returned if no replica is healthy,
+        if read_primary is True, or if the patient was written recently.
+        """
+        if read_primary or (patient_id is not None
+                            and recent_writes.get(patient_id)):
+            return None
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next]
+            self._next = (self._next + 1) % len(self.replicas)
+            if replica.healthy:
+                return replica.session_maker
+        return None
+
+    async def check_health(self) -> None:
+        """Check every replica, taking failing ones out of rotation."""
+        await asyncio.gather(*(self._check(replica)
+                               for replica in self.replicas))
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            replica.lag_seconds = await asyncio.wait_for(
+                replica.read_lag(),
+                settings.DATABASE_REPLICA_CHECK_TIMEOUT_SECONDS)
+            error = None
+            if replica.lag_seconds > settings.DATABASE_REPLICA_MAX_LAG_SECONDS:
+                error = f"lag {replica.lag_seconds:.1f} s"
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as exc:
+            replica.lag_seconds = None
+            error = repr(exc)
+        if error is not None and replica.healthy:
+            logger.warning("Replica %s out of rotation: %s",
+                           replica.name, error)
+        elif error is None and not replica.healthy:
+            logger.info("Replica %s in rotation", replica.name)
+        replica.healthy = error is None
+
+    async def run_health_checks(self) -> None:
+        """Check the replicas periodically."""
+        while True:
+            await asyncio.sleep(
+                settings.DATABASE_REPLICA_CHECK_INTERVAL_SECONDS)
+            await self.check_health()
+
+
+_replicas: dict[str, Replica] = {}
+
+
+def watch(replica: Replica) -> None:
+    """Publish the health and lag gauges of a replica."""
+    _replicas[replica.name] = replica
+
+
+def _replica_gauge(value):
+    """Make a callback reading a value of every watched replica."""
+    def callback() -> dict[str, float]:
+        return {name: value(replica) for name, replica in _replicas.items()}
+    return callback
+
+
+registry.gauge("db_replica_healthy",
+               "Whether the replica is in rotation (1) or not (0)",
+               _replica_gauge(lambda replica: int(replica.healthy)),
+               "replica")
+registry.gauge("db_replica_lag_seconds",
+               "Replication lag at the last health check (-1 if unknown)",
+               _replica_gauge(lambda replica: (
+                   -1 if replica.lag_seconds is None
+                   else replica.lag_seconds)),
+               "replica")
@@ -1,6 +1,11 @@
 """API router for medication requests."""
 
-from fastapi import APIRouter, Depends, status, Response, Request
+from typing import Annotated, AsyncIterator, Literal
+
+from fastapi import (
+    APIRouter, Depends, status, Response, Request, Header, Body, Query
+)
+from fastapi.responses import StreamingResponse
 
 from .. import settings
 from ..models.medication_request import (
@@ -8,34 +13,86 @@ from ..models.medication_request import (
     MedicationRequestOutput,
     MedicationRequestPatch,
     MedicationRequest,
-    MedicationRequestQueryParams
+    MedicationRequestQueryParams,
+    MedicationRequestBulkResult,
+    MedicationRequestTransition,
+    MedicationRequestTransitionResult
 )
-from ..database import DbDependency
+from ..database import DbDependency, ReadDbDependency, Database
 from .. import crud
+from .. import coalescer
+from .. import serialization
+from .. import export
+from ..models.patient import Patient
+from ..etag import (
+    version_etag, collection_etag, none_match, if_match_versions
+)
 
 router = APIRouter(tags=[settings.MEDICATION_REQUEST_TAG])
 router_plural = APIRouter(tags=[settings.MEDICATION_REQUEST_TAG])
 
 
-@router.get("/{medication_request_id}", response_model=MedicationRequestOutput)
-async def get_medication_request(patient_id: int,
-                                 medication_request_id: int,
-                                 db: DbDependency):
-    """Get medication request data."""
-    return await crud.read_medication_request(
+@router.get("/{medication_request_id}", response_model=MedicationRequestOutput,
+            responses={304: {"description": "Not modified"}})
+async def get_medication_request(
+        patient_id: int,
+        medication_request_id: int,
+        db: ReadDbDependency,
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None):
+    """Get medication request data.
+
+    The ETag is the version. If it matches If-None-Match, only the
+    version is read, and 304 Not Modified is returned with no body.
+    """
+    if if_none_match is not None:
+        etag = version_etag(await crud.read_medication_request_version(
+            db, medication_request_id, patient_id))
+        if not none_match(if_none_match, etag):
+            return _not_modified(etag)
+    result = await crud.read_medication_request(
         db, medication_request_id, patient_id)
+    response.headers["ETag"] = version_etag(result.version)
+    return _output(result, response)
 
 
 @router.post("/", response_model=MedicationRequest,
              status_code=status.HTTP_201_CREATED)
-async def post_medication_request(
+async def post_medication_request(  # pylint: disable=R0913,R0917
         patient_id: int,
         medication_request_input: MedicationRequestInput,
         db: DbDependency,
-        request: Request, response: Response):
-    """Create a new medication request."""
-    result = await crud.create_medication_request(
-        db, medication_request_input, patient_id)
+        request: Request, response: Response,
+        idempotency_key: Annotated[str | None, Header(
+            min_length=1,
+            max_length=settings.IDEMPOTENCY_KEY_MAX_LENGTH)] = None):
+    """Create a new medication request.
+
+    If an Idempotency-Key header is given, a retry with the same key and
+    content gets the original response, and does not create another
+    medication request. Reusing a key with different content is an error.
+
+    If the write coalescer is enabled, the insert is committed together
+    with those of other concurrent requests.
+    """
+    if idempotency_key is not None:
+        record, replayed = await crud.create_idempotent_medication_request(
+            db, medication_request_input, patient_id, idempotency_key)
+        headers = {"Location": str(request.url_for(
+            "get_medication_request", patient_id=patient_id,
+            medication_request_id=record.medication_request_id))}
+        if replayed:
+            headers[settings.IDEMPOTENT_REPLAYED_HEADER] = "true"
+        return Response(content=record.response_body,
+                        status_code=status.HTTP_201_CREATED,
+                        media_type=settings.JSON_MEDIA_TYPE, headers=headers)
+    if coalescer.writers:
+        writer = coalescer.writers[await Database.shard_for(patient_id)]
+        result = await writer.create_medication_request(
+            medication_request_input, patient_id)
+    else:
+        result = await crud.create_medication_request(
+            db, medication_request_input, patient_id)
     location_url = request.url_for(
         "get_medication_request",
         patient_id=patient_id,
@@ -45,22 +102,221 @@ async def post_medication_request(
 
 
 @router.patch("/{medication_request_id}",
-              response_model=MedicationRequestOutput)
-async def patch_medication_request(
+              response_model=MedicationRequestOutput,
+              responses={412: {"description": "Precondition failed"}})
+async def patch_medication_request(  # pylint: disable=R0913,R0917
         patient_id: int,
         medication_request_id: int,
         patch_data: MedicationRequestPatch,
-        db: DbDependency):
-    """Modify a subset of fields of a medication request."""
-    return await crud.update_medication_request(
-        db, patch_data, medication_request_id, patient_id)
+        db: DbDependency,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None):
+    """Modify a subset of fields of a medication request.
+
+    If If-Match is given, the update is only made if it matches the
+    current ETag, else 412 Precondition Failed is returned.
+    """
+    result = await crud.update_medication_request(
+        db, patch_data, medication_request_id, patient_id,
+        None if if_match is None else if_match_versions(if_match))
+    response.headers["ETag"] = version_etag(result.version)
+    return _output(result, response)
 
 
-@router_plural.get("/", response_model=list[MedicationRequestOutput])
+@router_plural.get("/", response_model=list[MedicationRequestOutput],
+                   responses={304: {"description": "Not modified"}})
 async def get_medication_requests(
-        db: DbDependency,
+        db: ReadDbDependency,
         patient_id: int,
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None,
         query_params: MedicationRequestQueryParams = Depends()):
-    """Get a filtered medication request collection."""
-    return await crud.read_filtered_medication_requests(
+    """Get a filtered medication request collection.
+
+    If more results are available than the limit, the cursor for the
+    next page is returned in a response header. The ETag depends on the
+    id and version of each result. If it matches If-None-Match, only
+    these are read, and 304 Not Modified is returned with no body.
+
+    If the result cache is enabled, the serialised response is cached
+    by patient and query, until the patient's next write.
+    """
+    cache_key = query_params.model_dump_json()
+    cached = crud.result_cache.get(patient_id, cache_key)
+    if cached is not None:
+        body, headers = cached
+        if not none_match(if_none_match, headers["ETag"]):
+            return _not_modified(headers["ETag"])
+        return Response(content=body, media_type=settings.JSON_MEDIA_TYPE,
+                        headers=headers)
+    if if_none_match is not None:
+        versions, has_next = (
+            await crud.read_filtered_medication_request_versions(
+                db, patient_id, query_params))
+        etag = collection_etag(query_params, versions, has_next)
+        if not none_match(if_none_match, etag):
+            return _not_modified(etag)
+    generation = crud.result_cache.generation(patient_id)
+    result, next_cursor = await crud.read_filtered_medication_requests(
         db, patient_id, query_params)
+    if next_cursor is not None:
+        response.headers[settings.NEXT_CURSOR_HEADER] = next_cursor
+    response.headers["ETag"] = collection_etag(
+        query_params, [(x.id, x.version) for x in result],
+        next_cursor is not None)
+    if not crud.result_cache.enabled:
+        return _output(result, response)
+    body = serialization.dump_json(result)
+    headers = {name: response.headers[name] for name in
+               ("ETag", settings.NEXT_CURSOR_HEADER)
+               if name in response.headers}
+    crud.result_cache.put(patient_id, cache_key, body, headers, generation)
+    return Response(content=body, media_type=settings.JSON_MEDIA_TYPE,
+                    headers=headers)
+
+
+@router_plural.post(
+    "/", response_model=list[MedicationRequestBulkResult],
+    status_code=status.HTTP_201_CREATED,
+    responses={207: {"model": list[MedicationRequestBulkResult],
+                     "description": "Some items were not created"}})
+async def post_medication_requests(
+        patient_id: int,
+        medication_request_inputs: Annotated[
+            list[MedicationRequestInput],
+            Body(min_length=1, max_length=settings.BULK_CREATE_MAX_ITEMS)],
+        db: DbDependency,
+        response: Response):
+    """Create many medication requests, in one transaction.
+
+    The result list has one item per input, in the same order. If any
+    item could not be created, the status is 207 Multi-Status.
+    """
+    results = await crud.create_medication_requests(
+        db, medication_request_inputs, patient_id)
+    bulk_results = []
+    for result in results:
+        if isinstance(result, crud.ResourceNotFoundError):
+            bulk_results.append(MedicationRequestBulkResult(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=result.message))
+        else:
+            bulk_results.append(MedicationRequestBulkResult(
+                status_code=status.HTTP_201_CREATED,
+                medication_request=result))
+    if any(x.medication_request is None for x in bulk_results):
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return bulk_results
+
+
+@router_plural.post("/status-transition",
+                    response_model=MedicationRequestTransitionResult)
+async def post_medication_requests_status_transition(
+        patient_id: int,
+        transition: MedicationRequestTransition,
+        db: DbDependency):
+    """Change the status of all matching medication requests at once.
+
+    For example, on discharge all active and on-hold requests can be
+    completed. The ids of the changed requests are returned.
+    """
+    ids = await crud.transition_medication_requests(
+        db, transition, patient_id)
+    return MedicationRequestTransitionResult(count=len(ids), ids=ids)
+
+
+@router_plural.get(
+    "/stream", response_model=list[MedicationRequestOutput],
+    responses={200: {"content": {settings.NDJSON_MEDIA_TYPE: {}}}})
+async def stream_medication_requests(
+        db: DbDependency,
+        patient_id: int,
+        accept: Annotated[str | None, Header()] = None,
+        query_params: MedicationRequestQueryParams = Depends()):
+    """Stream the whole filtered medication request collection.
+
+    Each result is serialised as soon as it is read, so memory use and
+    time to first byte do not depend on the collection size. Paging is
+    not applied. The format is newline-delimited JSON, unless only
+    JSON is acceptable, in which case a JSON array is sent.
+    """
+    medication_requests = await crud.stream_filtered_medication_requests(
+        db, await Database.read_session_maker_for(patient_id),
+        patient_id, query_params)
+    if accept is not None and accept.startswith(settings.JSON_MEDIA_TYPE):
+        return StreamingResponse(_json_array(medication_requests),
+                                 media_type=settings.JSON_MEDIA_TYPE)
+    return StreamingResponse(_ndjson(medication_requests),
+                             media_type=settings.NDJSON_MEDIA_TYPE)
+
+
+@router_plural.get(
+    "/export", response_class=StreamingResponse,
+    responses={200: {"content": {settings.NDJSON_MEDIA_TYPE: {},
+                                 settings.CSV_MEDIA_TYPE: {},
+                                 settings.GZIP_MEDIA_TYPE: {}}}})
+async def export_medication_requests(
+        db: DbDependency,
+        patient_id: int,
+        output_format: Annotated[
+            Literal["jsonl", "csv"], Query(alias="format")] = "jsonl",
+        gzip: bool = False):
+    """Export all of a patient's medication requests as a file.
+
+    The rows include the medication and clinician names. They are read
+    in short transactions and sent in chunks, optionally gzipped.
+    """
+    if not await crud.id_exists(db, patient_id, Patient):
+        raise crud.ResourceNotFoundError(Patient)
+    filename = f"medication-requests-{patient_id}.{output_format}"
+    media_type = (settings.CSV_MEDIA_TYPE if output_format == "csv"
+                  else settings.NDJSON_MEDIA_TYPE)
+    if gzip:
+        filename += ".gz"
+        media_type = settings.GZIP_MEDIA_TYPE
+    return StreamingResponse(
+        export.export_bytes(
+            await Database.read_session_maker_for(patient_id),
+            patient_id, output_format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition":
+                 f'attachment; filename="{filename}"'})
+
+
+async def _ndjson(
+        medication_requests: AsyncIterator[MedicationRequestOutput]
+) -> AsyncIterator[str]:
+    """Serialise the medication requests as newline-delimited JSON."""
+    async for item in medication_requests:
+        yield item.model_dump_json() + "\n"
+
+
+async def _json_array(
+        medication_requests: AsyncIterator[MedicationRequestOutput]
+) -> AsyncIterator[str]:
+    """Serialise the medication requests as a JSON array."""
+    separator = "["
+    async for item in medication_requests:
+        yield separator + item.model_dump_json()
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+def _not_modified(etag: str) -> Response:
+    """Make a 304 Not Modified response."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag})
+
+
+def _output(content, response: Response):
+    """Return content for the response_model, or as JSON bytes.
+
+    With FAST_SERIALIZATION, the content must be MedicationRequestOutput
+    (or a list of them) and is encoded directly, keeping any headers
+    already set on response.
+    """
+    if not settings.FAST_SERIALIZATION:
+        return content
+    return Response(content=serialization.dump_json(content),
+                    media_type=settings.JSON_MEDIA_TYPE,
+                    headers=dict(response.headers))
@@ -0,0 +1,42 @@
+"""Fast construction and JSON serialisation of medication request output.
+
+Data read from the database has already been validated on the way in,
+so output models are constructed without validation, and are encoded
+directly to JSON bytes by the precompiled pydantic-core serialiser
+rather than being revalidated through the route response_model.
+"""
+
+from typing import Any, Sequence
+
+from pydantic import TypeAdapter
+
+from .models.clinician import ClinicianName
+from .models.medication import MedicationCodeName
+from .models.medication_request import MedicationRequestOutput
+
+# The scalar output fields, read directly from a row or ORM object.
+OUTPUT_COLUMNS: tuple[str, ...] = tuple(
+    name for name in MedicationRequestOutput.model_fields
+    if name not in {"medication", "clinician"})
+
+_output_list_adapter = TypeAdapter(list[MedicationRequestOutput])
+
+
+def output_from_row(row: Any, medication: MedicationCodeName,
+                    clinician: ClinicianName) -> MedicationRequestOutput:
+    """Construct an output model from a trusted database row.
+
+    The row can be any object with the OUTPUT_COLUMNS as attributes.
+    """
+    fields = {name: getattr(row, name) for name in OUTPUT_COLUMNS}
+    fields["medication"] = medication
+    fields["clinician"] = clinician
+    return MedicationRequestOutput.model_construct(**fields)
+
+
+def dump_json(content: MedicationRequestOutput
+              | Sequence[MedicationRequestOutput]) -> bytes:
+    """Serialise one output model, or a list of them, to JSON bytes."""
+    if isinstance(content, MedicationRequestOutput):
+        return content.__pydantic_serializer__.to_json(content)
+    return _output_list_adapter.dump_json(list(content))
@@ -1,7 +1,82 @@
 """Parameter settings for the application."""
 
+import os
 from typing import Final
 
+# Database connection pool: the number of pooled connections, the
+# extra connections allowed under load, the time (s) to wait for a free
+# connection, the connection age (s) after which it is replaced (-1 for
+# never), and whether to test each connection before use (set to 1).
+DATABASE_POOL_SIZE: Final[int] = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW: Final[int] = int(
+    os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT: Final[float] = float(
+    os.environ.get("DATABASE_POOL_TIMEOUT", 30))
+DATABASE_POOL_RECYCLE: Final[int] = int(
+    os.environ.get("DATABASE_POOL_RECYCLE", -1))
+DATABASE_POOL_PRE_PING: Final[bool] = (
+    os.environ.get("DATABASE_POOL_PRE_PING", "0") == "1")
+
+# SQLite database files: the pragmas set on each connection, and the
+# number of read-only connections. Writes use a single connection. The
+# cache size is in KiB when negative; the busy timeout is in ms.
+SQLITE_PRAGMAS: Final[tuple[str, ...]] = (
+    "foreign_keys=ON", "journal_mode=WAL", "synchronous=NORMAL",
+    f"mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 2**20))}",
+    f"cache_size={int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 2**10))}",
+    f"busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+SQLITE_READER_POOL_SIZE: Final[int] = int(
+    os.environ.get("SQLITE_READER_POOL_SIZE", 4))
+
+# The number of prepared statements cached by each asyncpg connection
+# (0 disables the cache).
+ASYNCPG_STATEMENT_CACHE_SIZE: Final[int] = int(
+    os.environ.get("ASYNCPG_STATEMENT_CACHE_SIZE", 100))
+
+# Shards: comma-separated database URLs of the shards after the first,
+# which is DATABASE_URL (default none: one database). Patients are
+# assigned by the directory in the first shard, or else by id modulo
+# the number of shards. Directory entries are cached for the TTL (s).
+DATABASE_SHARD_URLS: Final[tuple[str, ...]] = tuple(
+    url.strip() for url in os.environ.get("DATABASE_SHARD_URLS", "").split(
+        ",") if url.strip())
+SHARD_DIRECTORY_CACHE_MAX_SIZE: Final[int] = 100000
+SHARD_DIRECTORY_TTL_SECONDS: Final[float] = float(
+    os.environ.get("SHARD_DIRECTORY_TTL_SECONDS", 60))
+
+# Read replicas of the first shard: comma-separated database URLs
+# (default none). Read-only routes use the replicas in turn, skipping
+# any which failed the last health check (checked at the interval, in
+# seconds) by not answering within the timeout or lagging by more than
+# the maximum lag (s).
+DATABASE_REPLICA_URLS: Final[tuple[str, ...]] = tuple(
+    url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(
+        ",") if url.strip())
+DATABASE_REPLICA_MAX_LAG_SECONDS: Final[float] = float(
+    os.environ.get("DATABASE_REPLICA_MAX_LAG_SECONDS", 5))
+DATABASE_REPLICA_CHECK_INTERVAL_SECONDS: Final[float] = float(
+    os.environ.get("DATABASE_REPLICA_CHECK_INTERVAL_SECONDS", 5))
+DATABASE_REPLICA_CHECK_TIMEOUT_SECONDS: Final[float] = 2
+
+# Read-your-writes: a patient's reads use the primary for this time (s)
+# after a write to the patient by the same process. At most the given
+# number of recently written patients are remembered.
+DATABASE_REPLICA_STICKY_SECONDS: Final[float] = float(
+    os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 5))
+READ_YOUR_WRITES_MAX_PATIENTS: Final[int] = 100000
+
+# Log every SQL statement (set DATABASE_ECHO=1). This is slow, so is
+# only for debugging.
+DATABASE_ECHO: Final[bool] = os.environ.get("DATABASE_ECHO", "0") == "1"
+
+# SQL statements taking at least this time (s) are logged as warnings.
+SLOW_QUERY_SECONDS: Final[float] = float(
+    os.environ.get("SLOW_QUERY_SECONDS", 0.5))
+
+# Add each request's SQL statement count and time to a Server-Timing
+# response header (set SERVER_TIMING=1).
+SERVER_TIMING: Final[bool] = os.environ.get("SERVER_TIMING", "0") == "1"
+
 # The maximum allowable length of a person's first name or last name string.
 NAME_PART_MAX_LENGTH: Final[int] = 100
 
@@ -15,6 +90,62 @@ MEDICATION_STRENGTH_DECIMAL_PLACES: Final[int] = 4
 # The maximum allowable length of a medication request frequency string.
 MED_REQUEST_FREQ_MAX_LENGTH: Final[int] = 100
 
+# The default and maximum number of medication requests in one page.
+MEDICATION_REQUESTS_DEFAULT_LIMIT: Final[int] = 100
+MEDICATION_REQUESTS_MAX_LIMIT: Final[int] = 1000
+
+# The maximum number of medication requests created by one bulk request.
+BULK_CREATE_MAX_ITEMS: Final[int] = 1000
+
+# The number of rows fetched at a time when streaming a collection.
+STREAM_YIELD_PER: Final[int] = 500
+
+# Media types for streamed collections: newline-delimited or array JSON.
+NDJSON_MEDIA_TYPE: Final[str] = "application/x-ndjson"
+JSON_MEDIA_TYPE: Final[str] = "application/json"
+
+# The number of rows read in each short transaction of an export, and
+# the media types of the export formats.
+EXPORT_CHUNK_SIZE: Final[int] = 1000
+CSV_MEDIA_TYPE: Final[str] = "text/csv"
+GZIP_MEDIA_TYPE: Final[str] = "application/gzip"
+
+# Size and entry lifetime of the Medication and Clinician name caches.
+REFERENCE_CACHE_MAX_SIZE: Final[int] = 10000
+REFERENCE_CACHE_TTL_SECONDS: Final[float] = 300
+
+# Size and entry lifetime of the cache of ids known to exist.
+EXISTENCE_CACHE_MAX_SIZE: Final[int] = 100000
+EXISTENCE_CACHE_TTL_SECONDS: Final[float] = 600
+
+# Opt-in: send GET and PATCH output as JSON bytes from the precompiled
+# serialiser, skipping response_model validation. Set to 1 to enable.
+FAST_SERIALIZATION: Final[bool] = (
+    os.environ.get("FAST_SERIALIZATION", "0") == "1")
+
+# Memory budget (bytes) and entry lifetime of the cache of serialised
+# collection results. It is disabled by default: each process has its
+# own cache, and only writes through the same process invalidate it.
+RESULT_CACHE_MAX_BYTES: Final[int] = int(
+    os.environ.get("RESULT_CACHE_MAX_BYTES", 0))
+RESULT_CACHE_TTL_SECONDS: Final[float] = 30
+
+# Opt-in group commit of concurrent POSTs: set WRITE_COALESCER=1 to
+# enable. Inserts are committed together after waiting at most the
+# window (seconds), or once the maximum batch size is reached.
+WRITE_COALESCER: Final[bool] = os.environ.get("WRITE_COALESCER", "0") == "1"
+WRITE_COALESCER_WINDOW_SECONDS: Final[float] = float(
+    os.environ.get("WRITE_COALESCER_WINDOW_SECONDS", 0.005))
+WRITE_COALESCER_MAX_BATCH_SIZE: Final[int] = int(
+    os.environ.get("WRITE_COALESCER_MAX_BATCH_SIZE", 100))
+
+# Idempotency keys for POST: the maximum key length, how long a key
+# (and the response it replays) is kept, and how often expired keys
+# are deleted.
+IDEMPOTENCY_KEY_MAX_LENGTH: Final[int] = 255
+IDEMPOTENCY_KEY_TTL_SECONDS: Final[float] = 24 * 60 * 60
+IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS: Final[float] = 60 * 60
+
 # API information strings.
 API_VERSION: Final[str] = "v0.1.0"
 API_DESCRIPTION: Final[str] = (
@@ -28,5 +159,17 @@ MEDICATION_REQUEST_URL_PREFIX: Final[str] = "medication-request"
 MEDICATION_REQUESTS_URL_PREFIX: Final[str] = "medication-requests"
 PATIENT_URL_PREFIX: Final[str] = "patient"
 
+# Media type of the metrics endpoint (Prometheus text format).
+METRICS_MEDIA_TYPE: Final[str] = "text/plain; version=0.0.4"
+
+# Response header carrying the cursor for the next page of a collection.
+NEXT_CURSOR_HEADER: Final[str] = "X-Next-Cursor"
+
+# Request header (any value) making a read use the primary database.
+READ_PRIMARY_HEADER: Final[str] = "X-Read-Primary"
+
+# Response header marking a replayed idempotent POST response.
+IDEMPOTENT_REPLAYED_HEADER: Final[str] = "Idempotent-Replayed"
+
 # API tags
 MEDICATION_REQUEST_TAG: Final[str] = "Medication Request"
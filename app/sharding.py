@@ -0,0 +1,126 @@
+"""Assignment of patients to database shards, and moving between them.
+
+All the medication request routes are scoped by patient, so each
+patient's rows (the patient, its medication requests and idempotency
+keys) are kept together in one shard. The reference tables (Medication
+and Clinician) must be loaded into every shard.
+
+A patient is on the shard given by the directory table in the first
+shard, or else by its id modulo the number of shards. Directory lookups
+are cached in each process, so after a patient is moved, other
+processes can use the old shard until their cached entry expires. Their
+requests then find no patient (patient existence is not cached when
+sharded), so they get a not-found error, except that a read racing the
+move itself can find the patient but none of its medication requests.
+Medication request ids must be unique across the shards (e.g. with a
+different sequence start in each shard), since they are kept by a move.
+"""
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import settings
+from .cache import LRUCache
+from .crud import ResourceNotFoundError, record_write
+from .metrics import registry
+from .models.idempotency_key import IdempotencyKey
+from .models.medication_request import MedicationRequest
+from .models.patient import Patient
+from .models.patient_shard import PatientShard
+
+# Shard numbers of the patients recently looked up by this process.
+directory_cache: LRUCache[int, int] = LRUCache(
+    settings.SHARD_DIRECTORY_CACHE_MAX_SIZE,
+    settings.SHARD_DIRECTORY_TTL_SECONDS)
+
+# The maximum number of ids in one IN list.
+_IN_LIST_SIZE = 1000
+
+registry.gauge("shard_directory_cache_size",
+               "Cached patient shard numbers",
+               lambda: directory_cache.stats()["size"])
+
+
+async def read_shard(db: AsyncSession, patient_id: int,
+                     shard_count: int) -> int:
+    """Get the number of the shard holding a patient's data."""
+    shard = directory_cache.get(patient_id)
+    if shard is None:
+        shard = (await db.execute(
+            select(PatientShard.shard).where(  # type: ignore
+                PatientShard.patient_id == patient_id))).scalar()
+        if shard is None:
+            shard = patient_id % shard_count
+        directory_cache.put(patient_id, shard)
+    return shard
+
+
+async def move_patient(
+        shards: list[async_sessionmaker[AsyncSession]], patient_id: int,
+        target_shard: int) -> int:
+    """Move a patient's rows to another shard.
+
+    The rows are copied to the target shard, the directory is updated,
+    and then the rows are deleted from the source shard. The patient's
+    rows are locked in the source shard (on PostgreSQL) until then, so
+    concurrent writes wait, and fail once the patient has gone (with a
+    database integrity error, if their check for the patient came
+    first). The number of medication requests moved is returned.
+    """
+    directory_cache.invalidate(patient_id)
+    async with shards[0]() as directory:
+        source_shard = await read_shard(directory, patient_id, len(shards))
+    directory_cache.invalidate(patient_id)
+    if source_shard == target_shard:
+        return 0
+    tables = (Patient.__table__, MedicationRequest.__table__,  # type: ignore
+              IdempotencyKey.__table__)  # type: ignore
+    async with shards[source_shard]() as source:
+        async with source.begin():
+            rows = await _read_patient_rows(source, patient_id)
+            if not rows[0]:
+                raise ResourceNotFoundError(Patient)
+            async with shards[target_shard]() as target:
+                async with target.begin():
+                    for table, table_rows in zip(tables, rows):
+                        if table_rows:
+                            await target.execute(insert(table), table_rows)
+            async with shards[0]() as directory:
+                async with directory.begin():
+                    await directory.execute(delete(PatientShard).where(
+                        PatientShard.patient_id == patient_id))  # type: ignore
+                    await directory.execute(insert(PatientShard), [
+                        {"patient_id": patient_id, "shard": target_shard}])
+            for table, table_rows in reversed(list(zip(tables, rows))):
+                key = table.primary_key.columns[0]
+                for offset in range(0, len(table_rows), _IN_LIST_SIZE):
+                    await source.execute(delete(table).where(key.in_(
+                        [row[key.name] for row in
+                         table_rows[offset:offset + _IN_LIST_SIZE]])))
+    directory_cache.invalidate(patient_id)
+    record_write(patient_id)
+    return len(rows[1])
+
+
+async def _read_patient_rows(db: AsyncSession,
+                             patient_id: int) -> list[list[dict]]:
+    """Read and lock the patient, medication request and key rows."""
+    patients = (await db.execute(
+        select(Patient.__table__)  # type: ignore
+        .where(Patient.id == patient_id)  # type: ignore
+        .with_for_update())).mappings()
+    medication_requests = (await db.execute(
+        select(MedicationRequest.__table__)  # type: ignore
+        .where(MedicationRequest.patient_id == patient_id)  # type: ignore
+        .order_by(MedicationRequest.id)  # type: ignore
+        .with_for_update())).mappings()
+    patient_rows = [dict(row) for row in patients]
+    request_rows = [dict(row) for row in medication_requests]
+    ids = [row["id"] for row in request_rows]
+    key_rows: list[dict] = []
+    for offset in range(0, len(ids), _IN_LIST_SIZE):
+        key_rows.extend(dict(row) for row in (await db.execute(
+            select(IdempotencyKey.__table__).where(  # type: ignore
+                IdempotencyKey.medication_request_id.in_(  # type: ignore
+                    ids[offset:offset + _IN_LIST_SIZE])))).mappings())
+    return [patient_rows, request_rows, key_rows]
@@ -0,0 +1,80 @@
+"""Benchmark creating many medication requests.
+
+Compare one crud.create_medication_request call per item, the same
+calls made concurrently through the write coalescer, and a single
+crud.create_medication_requests call, for the time per item. This uses
+a temporary SQLite database.
+
+Run with: python -m benchmarks.bulk_create
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import (
+    AsyncSession, async_sessionmaker, create_async_engine
+)
+from sqlmodel import SQLModel
+
+from app import crud
+from app.coalescer import WriteCoalescer
+from app.models.medication_request import MedicationRequestInput
+from tests import data
+
+ITEM_COUNT = 1000
+
+
+async def single(engine, inputs):
+    """Create each item in its own session, as one POST per item."""
+    for medication_request_input in inputs:
+        async with AsyncSession(engine) as session:
+            await crud.create_medication_request(
+                session, medication_request_input, 1)
+
+
+async def coalesced(engine, inputs):
+    """Create each item concurrently, with group commits."""
+    writer = WriteCoalescer(async_sessionmaker(engine), 0.005, 100)
+    await asyncio.gather(*[writer.create_medication_request(x, 1)
+                           for x in inputs])
+    return writer.stats()
+
+
+async def bulk(engine, inputs):
+    """Create all items in one transaction."""
+    async with AsyncSession(engine) as session:
+        await crud.create_medication_requests(session, inputs, 1)
+
+
+async def main():
+    """Print the time per item for each way of creating."""
+    medication_request_input = MedicationRequestInput(
+        **data.valid_medication_request_input.model_dump())
+    medication_request_input.clinician_id = 2
+    medication_request_input.medication_id = 3
+    inputs = [medication_request_input] * ITEM_COUNT
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await data.add_patient(1, session)
+            await data.add_clinician(2, session)
+            await data.add_medication(3, session)
+            await session.commit()
+        print(f"{ITEM_COUNT} items")
+        print(f"{'create':>10} {'us/item':>8}")
+        for name, create in [("single", single), ("coalesced", coalesced),
+                             ("bulk", bulk)]:
+            start = time.perf_counter()
+            stats = await create(engine, inputs)
+            micros = (time.perf_counter() - start) * 1e6 / ITEM_COUNT
+            print(f"{name:>10} {micros:>8.1f}", stats or "")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Benchmark reading a large medication request collection.
+
+Compare full ORM entity hydration (with and without the joined
+medication and clinician) to the column projection used by
+crud.read_filtered_medication_requests, for CPU time and peak Python
+memory per row. Each way of reading produces the same output models.
+This uses a temporary SQLite database.
+
+Run with: python -m benchmarks.projection
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import noload
+from sqlmodel import SQLModel
+
+from app import crud
+from app.models.medication_request import MedicationRequest
+from app.serialization import output_from_row
+from app.models.types import MedicationRequestStatus
+from tests import data
+
+ROW_COUNT = 10000
+REPEATS = 5
+
+
+async def add_rows(session: AsyncSession):
+    """Add one patient with ROW_COUNT medication requests."""
+    await data.add_patient(1, session)
+    await data.add_clinician(2, session)
+    await data.add_medication(3, session)
+    await session.execute(insert(MedicationRequest), [
+        {"patient_id": 1, "clinician_id": 2, "medication_id": 3,
+         "reason": "A reason for the medication request.",
+         "prescribed_date": date(2020, 1, 1) + timedelta(days=i),
+         "start_date": date(2020, 1, 2) + timedelta(days=i),
+         "end_date": None, "frequency": "daily",
+         "status": MedicationRequestStatus.ACTIVE}
+        for i in range(ROW_COUNT)])
+    await session.commit()
+
+
+async def entity_joined(session: AsyncSession):
+    """Load entities with the joined medication and clinician."""
+    result = await session.execute(
+        select(MedicationRequest).filter_by(patient_id=1))
+    return [output_from_row(x, x.medication, x.clinician)
+            for x in result.scalars().all()]
+
+
+async def entity_noload(session: AsyncSession):
+    """Load entities only, and add the cached names."""
+    result = await session.execute(
+        select(MedicationRequest).filter_by(patient_id=1).options(
+            noload(MedicationRequest.medication),  # type: ignore
+            noload(MedicationRequest.clinician)))  # type: ignore
+    return await crud._with_names(  # pylint: disable=W0212
+        session, result.scalars().all())
+
+
+async def projection(session: AsyncSession):
+    """Read the output column rows, and add the cached names."""
+    result = await session.execute(
+        select(*crud._OUTPUT_COLUMNS).filter_by(  # pylint: disable=W0212
+            patient_id=1))
+    return await crud._with_names(  # pylint: disable=W0212
+        session, result.all())
+
+
+async def measure(engine, read) -> tuple[float, float]:
+    """Get the best time (us) and peak memory (bytes) per row."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        async with AsyncSession(engine) as session:
+            start = time.perf_counter()
+            await read(session)
+            best = min(best, time.perf_counter() - start)
+    async with AsyncSession(engine) as session:
+        tracemalloc.start()
+        await read(session)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best * 1e6 / ROW_COUNT, peak / ROW_COUNT
+
+
+async def main():
+    """Print the time and memory per row for each way of reading."""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await add_rows(session)
+        print(f"{ROW_COUNT} rows")
+        print(f"{'read':>16} {'us/row':>8} {'peak bytes/row':>15}")
+        for name, read in [("entity (joined)", entity_joined),
+                           ("entity (noload)", entity_noload),
+                           ("projection", projection)]:
+            micros, peak = await measure(engine, read)
+            print(f"{name:>16} {micros:>8.2f} {peak:>15.0f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
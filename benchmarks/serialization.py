@@ -0,0 +1,86 @@
+"""Benchmark the response serialisation of medication request collections.
+
+Compare the default path (FastAPI revalidating the output through the
+response_model, then encoding with the standard library) to the fast
+path (unvalidated construction plus the precompiled serialiser).
+
+Run with: python -m benchmarks.serialization
+"""
+
+import asyncio
+import time
+from datetime import date
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import serialization
+from app.models.clinician import ClinicianName
+from app.models.medication import MedicationCodeName
+from app.models.medication_request import (
+    MedicationRequest,
+    MedicationRequestOutput
+)
+from app.models.types import MedicationRequestStatus
+
+ROW_COUNTS = (100, 1000, 10000)
+REPEATS = 5
+
+
+def make_rows(count: int) -> list[MedicationRequest]:
+    """Make unsaved medication request rows."""
+    return [MedicationRequest(
+        id=i, version=1, patient_id=1, clinician_id=2, medication_id=3,
+        reason="A reason for the medication request.",
+        prescribed_date=date(2024, 1, 5), start_date=date(2024, 1, 6),
+        end_date=date(2024, 4, 5), frequency="3 times/day",
+        status=MedicationRequestStatus.ACTIVE) for i in range(count)]
+
+
+async def default_path(rows: list[MedicationRequest]) -> bytes:
+    """Validate outputs, then serialise through the response_model."""
+    medication = MedicationCodeName(code_name="Paracetamol")
+    clinician = ClinicianName(first_name="John", last_name="Doctor")
+    outputs = [MedicationRequestOutput.model_validate(
+        x.model_dump() | {"medication": medication, "clinician": clinician})
+        for x in rows]
+    field = create_response_field(
+        name="response", type_=list[MedicationRequestOutput])
+    content = await serialize_response(
+        field=field, response_content=outputs, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast_path(rows: list[MedicationRequest]) -> bytes:
+    """Construct outputs without validation and serialise directly."""
+    medication = MedicationCodeName(code_name="Paracetamol")
+    clinician = ClinicianName(first_name="John", last_name="Doctor")
+    return serialization.dump_json([serialization.output_from_row(
+        x, medication, clinician) for x in rows])
+
+
+async def time_per_row(path, rows: list[MedicationRequest]) -> float:
+    """Get the best time per row in microseconds."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        await path(rows)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(rows)
+
+
+async def main():
+    """Print the time per row for each path and collection size."""
+    print(f"{'rows':>8} {'default us/row':>15} {'fast us/row':>12} "
+          f"{'speed-up':>9}")
+    for count in ROW_COUNTS:
+        rows = make_rows(count)
+        default = await time_per_row(default_path, rows)
+        fast = await time_per_row(fast_path, rows)
+        print(f"{count:>8} {default:>15.2f} {fast:>12.2f} "
+              f"{default / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
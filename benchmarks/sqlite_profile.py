@@ -0,0 +1,137 @@
+"""Benchmark concurrent reads and writes on an SQLite database file.
+
+Compare the previous setup (one pool of connections shared by reads and
+writes, foreign keys on, default rollback journal) with the SQLite
+profile set up by Database.init_db (WAL and the other pragmas, a single
+writer connection and a pool of read-only connections). Concurrent
+tasks read pages of a patient's medication requests and create new
+ones for a fixed time; the reads and writes per second and the failed
+operations (e.g. "database is locked") are printed.
+
+Run with: python -m benchmarks.sqlite_profile
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app import crud
+from app.database import Database, pool_options
+from app.models.medication_request import (
+    MedicationRequestInput,
+    MedicationRequestQueryParams
+)
+from tests import data
+
+DURATION_SECONDS = 5
+READERS = 8
+WRITERS = 4
+INITIAL_ROWS = 1000
+
+
+async def reader(session_maker, deadline: float, counts: dict[str, int]):
+    """Read pages of medication requests until the deadline."""
+    while time.perf_counter() < deadline:
+        try:
+            async with session_maker() as db:
+                await crud.read_filtered_medication_requests(
+                    db, 1, MedicationRequestQueryParams(limit=20))
+            counts["reads"] += 1
+        except SQLAlchemyError:
+            counts["errors"] += 1
+
+
+async def writer(session_maker, deadline: float, counts: dict[str, int],
+                 medication_request_input: MedicationRequestInput):
+    """Create medication requests until the deadline."""
+    while time.perf_counter() < deadline:
+        try:
+            async with session_maker() as db:
+                await crud.create_medication_request(
+                    db, medication_request_input, 1)
+            counts["writes"] += 1
+        except SQLAlchemyError:
+            counts["errors"] += 1
+
+
+async def measure(read_maker, write_maker) -> dict[str, int]:
+    """Run the readers and writers, returning the operation counts."""
+    medication_request_input = MedicationRequestInput(
+        **data.valid_medication_request_input.model_dump())
+    medication_request_input.clinician_id = 2
+    medication_request_input.medication_id = 3
+    async with write_maker() as db:
+        await crud.create_medication_requests(
+            db, [medication_request_input] * INITIAL_ROWS, 1)
+    crud.existence_cache.clear()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + DURATION_SECONDS
+    await asyncio.gather(
+        *[reader(read_maker, deadline, counts) for _ in range(READERS)],
+        *[writer(write_maker, deadline, counts, medication_request_input)
+          for _ in range(WRITERS)])
+    return counts
+
+
+async def create_database(url: str):
+    """Create the tables and the referenced rows."""
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with async_sessionmaker(engine)() as db:
+        await data.add_patient(1, db)
+        await data.add_clinician(2, db)
+        await data.add_medication(3, db)
+    await engine.dispose()
+
+
+async def previous(url: str) -> dict[str, int]:
+    """Measure the shared pool without the SQLite profile."""
+    engine = create_async_engine(url, **pool_options(url, "previous"))
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_foreign_keys(connection, _connection_record):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        return await measure(session_maker, session_maker)
+    finally:
+        await engine.dispose()
+
+
+async def profile(url: str) -> dict[str, int]:
+    """Measure the writer and reader engines of the SQLite profile."""
+    os.environ["DATABASE_URL"] = url
+    await Database.init_db()
+    try:
+        return await measure(Database.read_shards[0],  # type: ignore
+                             Database.shards[0])  # type: ignore
+    finally:
+        await Database.close_db()
+
+
+async def main():
+    """Print the reads and writes per second for each setup."""
+    print(f"{READERS} readers, {WRITERS} writers, {DURATION_SECONDS} s")
+    print(f"{'setup':>10} {'reads/s':>8} {'writes/s':>8} {'errors':>6}")
+    for name, run in [("previous", previous), ("profile", profile)]:
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+            await create_database(url)
+            counts = await run(url)
+        print(f"{name:>10} {counts['reads'] / DURATION_SECONDS:>8.0f}"
+              f" {counts['writes'] / DURATION_SECONDS:>8.0f}"
+              f" {counts['errors']:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""Benchmark the Python-side cost of the crud read statements.
+
+Compare building each filtered collection query and id_exists check
+afresh for every call (as before the statements were cached by filter
+shape) with reusing the cached parameterized statements, for the time
+per query. The queries are small, so the time is mostly Python-side:
+statement construction, SQLAlchemy cache key generation and result
+handling. The SQL compilation cache hits and misses are also shown.
+
+By default this uses a temporary SQLite database. With --url, a scratch
+PostgreSQL (asyncpg) database can be given instead; its tables are
+created and a test patient is added. It is then also run without the
+asyncpg prepared statement cache, to show the server-side saving.
+
+Run with: python -m benchmarks.statements [--url URL]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert, make_url, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app import crud, instrumentation, settings
+from app.models.medication_request import (
+    MedicationRequest,
+    MedicationRequestCursor,
+    MedicationRequestQueryParams
+)
+from app.models.patient import Patient
+from app.models.types import MedicationRequestStatus
+from tests import data
+
+QUERY_COUNT = 2000
+ROW_COUNT = 100
+
+# Query parameters of several filter shapes, used in turn.
+QUERY_PARAMS = [
+    MedicationRequestQueryParams(limit=10),
+    MedicationRequestQueryParams(limit=10,
+                                 status=MedicationRequestStatus.ACTIVE),
+    MedicationRequestQueryParams(limit=10,
+                                 filter_start_date=date(2024, 1, 10),
+                                 filter_end_date=date(2024, 3, 1)),
+    MedicationRequestQueryParams(limit=10, cursor=MedicationRequestCursor(
+        prescribed_date=date(2024, 1, 20), id=20).encode())]
+
+
+def rebuilt(patient_id, query_params):
+    """Build the statement afresh, bypassing the statement cache."""
+    statement, parameters = crud._filtered_medication_requests_query(
+        patient_id, query_params, *crud._OUTPUT_COLUMNS)
+    statement = crud._filtered_statement.__wrapped__(
+        crud._OUTPUT_COLUMNS, bool(query_params.status),
+        bool(query_params.filter_start_date),
+        bool(query_params.filter_end_date),
+        query_params.position is not None, True)
+    return statement, parameters
+
+
+def cached(patient_id, query_params):
+    """Get the cached statement, as crud does."""
+    return crud._filtered_medication_requests_query(
+        patient_id, query_params, *crud._OUTPUT_COLUMNS)
+
+
+async def run(engine, get_statement, exists_statement) -> float:
+    """Get the time (us) per filtered query and existence check."""
+    async with AsyncSession(engine) as session:
+        start = time.perf_counter()
+        for number in range(QUERY_COUNT):
+            query_params = QUERY_PARAMS[number % len(QUERY_PARAMS)]
+            (await session.execute(
+                *get_statement(1, query_params))).all()
+            (await session.execute(exists_statement(Patient),
+                                   {"object_id": 1})).scalar()
+        return (time.perf_counter() - start) * 1e6 / QUERY_COUNT
+
+
+async def add_rows(engine):
+    """Create the tables and a patient with ROW_COUNT requests."""
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        if (await session.execute(select(Patient.id))).first() is not None:
+            return
+        await data.add_patient(1, session)
+        await data.add_clinician(2, session)
+        await data.add_medication(3, session)
+        row = data.valid_medication_request_input.model_dump()
+        await session.execute(insert(MedicationRequest), [
+            row | {"patient_id": 1, "clinician_id": 2, "medication_id": 3,
+                   "prescribed_date": date(2024, 1, 1) + timedelta(days=n)}
+            for n in range(ROW_COUNT)])
+        await session.commit()
+
+
+async def compare(url: str, **options):
+    """Print the time per query with rebuilt and cached statements."""
+    engine = create_async_engine(url, **options)
+    instrumentation.instrument(engine)
+    await add_rows(engine)
+    for name, get_statement, exists_statement in [
+            ("rebuilt", rebuilt, crud._exists_statement.__wrapped__),
+            ("cached", cached, crud._exists_statement)]:
+        await run(engine, get_statement, exists_statement)  # warm up
+        instrumentation._compiled_cache.clear()
+        micros = await run(engine, get_statement, exists_statement)
+        print(f"{name:>10} {micros:>10.1f}", instrumentation._compiled_cache)
+    await engine.dispose()
+
+
+async def main():
+    """Print the time per query for each statement strategy."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--url", help="scratch asyncpg database URL")
+    args = parser.parse_args()
+    print(f"{QUERY_COUNT} queries and existence checks")
+    print(f"{'statement':>10} {'us/query':>10}")
+    if args.url is None:
+        with tempfile.TemporaryDirectory() as directory:
+            await compare(
+                f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        return
+    if make_url(args.url).get_driver_name() == "asyncpg":
+        for size in (0, settings.ASYNCPG_STATEMENT_CACHE_SIZE):
+            print(f"prepared_statement_cache_size={size}")
+            await compare(args.url, connect_args={
+                "prepared_statement_cache_size": size})
+    else:
+        await compare(args.url)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
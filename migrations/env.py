@@ -13,6 +13,8 @@ from app.models.clinician import Clinician  # noqa
 from app.models.medication import Medication  # noqa
 from app.models.patient import Patient  # noqa
 from app.models.medication_request import MedicationRequest  # noqa
+from app.models.idempotency_key import IdempotencyKey  # noqa
+from app.models.patient_shard import PatientShard  # noqa
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,29 @@
+"""medication request version
+
+Revision ID: 4e7b9c2d1a60
+Revises: 8c1f2a4b7d3e
+Create Date: 2026-10-18 11:02:47.125340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e7b9c2d1a60'
+down_revision: Union[str, None] = '8c1f2a4b7d3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('medicationrequest',
+                  sa.Column('version', sa.Integer(), server_default='1',
+                            nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('medicationrequest') as batch_op:
+        batch_op.drop_column('version')
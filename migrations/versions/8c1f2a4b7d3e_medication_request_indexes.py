@@ -0,0 +1,44 @@
+"""medication request indexes
+
+Revision ID: 8c1f2a4b7d3e
+Revises: 2dd0ce5624b5
+Create Date: 2026-10-18 10:12:31.412087
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f2a4b7d3e'
+down_revision: Union[str, None] = '2dd0ce5624b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Index name: indexed columns.
+INDEXES = {
+    'ix_medicationrequest_patient_id_prescribed_date_id':
+        ['patient_id', 'prescribed_date', 'id'],
+    'ix_medicationrequest_patient_id_status_prescribed_date_id':
+        ['patient_id', 'status', 'prescribed_date', 'id'],
+    'ix_medicationrequest_clinician_id': ['clinician_id'],
+    'ix_medicationrequest_medication_id': ['medication_id'],
+}
+
+
+def upgrade() -> None:
+    # On PostgreSQL, build the indexes without locking the table against
+    # writes. CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'medicationrequest', columns,
+                            unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in reversed(INDEXES):
+            op.drop_index(name, table_name='medicationrequest',
+                          if_exists=True, postgresql_concurrently=True)
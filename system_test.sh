@@ -121,7 +121,7 @@ json_data='{
 expected_response='{
 "status":"active","frequency":"daily","prescribed_date":"2024-07-25",
 "clinician_id":1,"id":3,"end_date":"2024-08-25","reason":"Pain relief",
-"start_date":"2024-07-26","medication_id":1,"patient_id":1}'
+"start_date":"2024-07-26","medication_id":1,"patient_id":1,"version":1}'
 
 test_request GET "/patient/1/medication-request/1" 200
 test_request POST "/patient/1/medication-request" 201 "$json_data"
@@ -1,4 +1,19 @@
 """Provide fixtures for all pytests in directory."""
 # flake8: noqa
 
+import pytest
+
+from app import reference, crud, replicas, sharding
 from .sqlite_setup import session, async_session
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Stop cached database state leaking between tests."""
+    reference.medication_names.clear()
+    reference.clinician_names.clear()
+    crud.existence_cache.clear()
+    crud.result_cache.clear()
+    replicas.recent_writes.clear()
+    sharding.directory_cache.clear()
+    yield
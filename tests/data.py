@@ -9,6 +9,7 @@ from app.models.types import MedicationRequestStatus, Sex
 from app.models.medication_request import MedicationCodeName, ClinicianName
 from app.models.medication_request import MedicationRequestOutput
 from app.models.medication_request import MedicationRequestInput
+from app.models.medication_request import MedicationRequest
 from app.models.clinician import Clinician
 from app.models.medication import Medication, MedicationForm
 from app.models.patient import Patient
@@ -16,6 +17,7 @@ from app.models.patient import Patient
 
 valid_medication_request = MedicationRequestOutput(
     id=999,
+    version=1,
     reason="the reason text goes in this field.",
     prescribed_date=date(2024, 1, 5),
     start_date=date(2024, 1, 6),
@@ -84,3 +86,17 @@ async def add_medication(id: int, db_async_session: AsyncSession):
     await db_async_session.commit()
     await db_async_session.refresh(new_medication)
     assert new_medication.id == id
+
+
+async def add_medication_request(
+        id: int, patient_id: int, clinician_id: int, medication_id: int,
+        db_async_session: AsyncSession, **changes):
+    new_medication_request = MedicationRequest(
+        **(valid_medication_request_input.model_dump() | changes),
+        patient_id=patient_id, id=id)
+    new_medication_request.clinician_id = clinician_id
+    new_medication_request.medication_id = medication_id
+    db_async_session.add(new_medication_request)
+    await db_async_session.commit()
+    await db_async_session.refresh(new_medication_request)
+    assert new_medication_request.id == id
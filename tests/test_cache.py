@@ -0,0 +1,87 @@
+"""Tests for the cache.py module."""
+
+from unittest.mock import patch
+
+from app.cache import LRUCache, ExistenceCache, ResultCache
+
+
+def test_lru_cache_eviction():
+    cache: LRUCache[int, str] = LRUCache(maxsize=2, ttl=60)
+    assert cache.get(1) is None
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.get(1) == "a"
+    cache.put(3, "c")  # evicts 2, the least recently used
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert len(cache) == 2
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 2}
+
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    cache.clear()
+    assert cache.stats() == {"size": 0, "hits": 0, "misses": 0}
+
+
+def test_lru_cache_expiry():
+    cache: LRUCache[int, str] = LRUCache(maxsize=2, ttl=10)
+    with patch("time.monotonic", return_value=100):
+        cache.put(1, "a")
+    with patch("time.monotonic", return_value=109):
+        assert cache.get(1) == "a"
+    with patch("time.monotonic", return_value=111):
+        assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_disabled():
+    cache: LRUCache[int, str] = LRUCache(maxsize=0, ttl=10)
+    cache.put(1, "a")
+    assert cache.get(1) is None
+
+
+def test_existence_cache():
+    cache = ExistenceCache(maxsize=10, ttl=60)
+    assert not cache.contains(int, 1)
+    cache.add(int, 1)
+    assert cache.contains(int, 1)
+    assert not cache.contains(str, 1)
+    cache.discard(int, 1)
+    assert not cache.contains(int, 1)
+
+
+def test_result_cache():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    headers = {"ETag": '"x"'}  # 7 bytes
+    cache.put(1, "a", b"x" * 33, headers, cache.generation(1))
+    cache.put(1, "b", b"y" * 33, headers, cache.generation(1))
+    cache.put(2, "a", b"z" * 33, headers, cache.generation(2))
+    assert cache.get(1, "a") is None  # evicted to stay within budget
+    assert cache.get(1, "b") == (b"y" * 33, headers)
+    assert cache.get(2, "a") == (b"z" * 33, headers)
+    assert cache.size_bytes == 80
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hit_rate"] == 2 / 3
+
+    cache.invalidate(1)
+    assert cache.get(1, "b") is None
+    assert cache.get(2, "a") is not None
+    assert cache.size_bytes == 40
+
+
+def test_result_cache_stale_put():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    generation = cache.generation(1)
+    cache.invalidate(1)  # a write during the read
+    cache.put(1, "a", b"old", {}, generation)
+    assert cache.get(1, "a") is None
+    cache.put(1, "a", b"new", {}, cache.generation(1))
+    assert cache.get(1, "a") == (b"new", {})
+
+
+def test_result_cache_disabled():
+    cache = ResultCache(max_bytes=0, ttl=60)
+    assert not cache.enabled
+    cache.put(1, "a", b"x", {}, 0)
+    assert cache.get(1, "a") is None
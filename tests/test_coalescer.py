@@ -0,0 +1,107 @@
+"""Tests for the coalescer.py module."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import crud
+from app.coalescer import WriteCoalescer
+from app.models.medication_request import (
+    MedicationRequest,
+    MedicationRequestInput,
+    MedicationRequestQueryParams
+)
+from app.models.clinician import Clinician
+from . import data
+
+
+def make_input(clinician_id: int, medication_id: int):
+    medication_request_input = MedicationRequestInput(
+        **data.valid_medication_request_input.model_dump())
+    medication_request_input.clinician_id = clinician_id
+    medication_request_input.medication_id = medication_id
+    return medication_request_input
+
+
+async def add_references(db_session):
+    await data.add_patient(1, db_session)
+    await data.add_clinician(2, db_session)
+    await data.add_medication(3, db_session)
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_creates_db(async_session):
+    async for db_session in async_session:
+        await add_references(db_session)
+        writer = WriteCoalescer(async_sessionmaker(db_session.bind),
+                                window=0.05, max_batch_size=3)
+        inputs = [make_input(2, 3), make_input(99, 3), make_input(2, 3),
+                  make_input(2, 3), make_input(2, 3)]
+
+        results = await asyncio.gather(
+            *[writer.create_medication_request(x, 1) for x in inputs],
+            return_exceptions=True)
+
+        assert [type(x) for x in results] == [
+            MedicationRequest, crud.ResourceNotFoundError, MedicationRequest,
+            MedicationRequest, MedicationRequest]
+        assert results[1].resource_class == Clinician
+        assert len({x.id for x in results if isinstance(x, MedicationRequest)}
+                   ) == 4
+        # The first batch was full; the second was written by the timer.
+        stats = writer.stats()
+        assert stats["batches"] == 2
+        assert stats["items"] == 5
+        assert stats["largest_batch"] == 3
+        assert stats["mean_wait_seconds"] > 0
+        assert crud.result_cache.generation(1) == 2
+
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert len(items) == 4
+        await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_batch_failure_db(async_session):
+    """A failed batch is retried one item at a time."""
+    async for db_session in async_session:
+        await add_references(db_session)
+        writer = WriteCoalescer(async_sessionmaker(db_session.bind),
+                                window=1, max_batch_size=2)
+        insert = crud.insert_medication_requests
+
+        async def fail_batches(db, items):
+            if len(items) > 1 or items[0][1].frequency == "bad":
+                raise OperationalError("INSERT", {}, Exception())
+            return await insert(db, items)
+
+        bad_input = make_input(2, 3)
+        bad_input.frequency = "bad"
+        with patch('app.crud.insert_medication_requests',
+                   side_effect=fail_batches):
+            results = await asyncio.gather(
+                writer.create_medication_request(make_input(2, 3), 1),
+                writer.create_medication_request(bad_input, 1),
+                return_exceptions=True)
+
+        assert isinstance(results[0], MedicationRequest)
+        assert isinstance(results[1], OperationalError)
+        assert writer.stats()["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_close_writes_queued_items_db(async_session):
+    async for db_session in async_session:
+        await add_references(db_session)
+        writer = WriteCoalescer(async_sessionmaker(db_session.bind),
+                                window=60, max_batch_size=100)
+        task = asyncio.create_task(
+            writer.create_medication_request(make_input(2, 3), 1))
+        await asyncio.sleep(0)
+        await writer.close()
+        assert isinstance(await task, MedicationRequest)
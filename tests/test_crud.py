@@ -1,15 +1,26 @@
 """Tests for the crud.py module."""
 
-from unittest.mock import AsyncMock, Mock
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app import crud
+from app import crud, settings
 from app.models.medication_request import (
     MedicationRequest,
-    MedicationRequestInput
+    MedicationRequestInput,
+    MedicationRequestQueryParams,
+    MedicationRequestOutput,
+    MedicationRequestPatch,
+    MedicationRequestTransition
 )
 from app.models.patient import Patient
+from app.models.clinician import Clinician
+from app.models.medication import Medication
+from app.models.types import MedicationRequestStatus
+from app.models.idempotency_key import IdempotencyKey
 from . import data
 
 
@@ -21,6 +32,8 @@ class MockAsyncContext(AsyncMock):
         self.add = Mock()
         result = Mock()
         self.execute = AsyncMock(return_value=result)
+        self.in_transaction = Mock(return_value=False)
+        self.info = {}
 
     def begin(self):
         return self
@@ -41,24 +54,33 @@ async def test_create_medication_request_success():
         **data.valid_medication_request_input.model_dump())
     patient_id = 3
 
-    db.get.side_effect = [True, True, True]  # All resources found
-    db.refresh.return_value = None
+    # All resources found
+    crud.existence_cache.add(Patient, patient_id)
+    crud.existence_cache.add(Clinician,
+                             medication_request_input.clinician_id)
+    crud.existence_cache.add(Medication,
+                             medication_request_input.medication_id)
+    row = Mock()
+    row._asdict.return_value = (medication_request_input.model_dump()
+                                | {"patient_id": patient_id, "id": 7,
+                                   "version": 1})
+    db.execute.return_value = [row]
 
     medication_request = await crud.create_medication_request(
                 db, medication_request_input, patient_id)
 
-    db.add.assert_called_once()
+    db.execute.assert_awaited_once()  # the INSERT ... RETURNING only
     db.commit.assert_called_once()
-    db.refresh.assert_called_once()
-    medication_request_internal = db.add.call_args[0][0]
+    db.refresh.assert_not_called()
+    assert crud.result_cache.generation(patient_id) == 1  # invalidated
 
     # Assert return values/types
     assert isinstance(medication_request, MedicationRequest)
-    assert medication_request_internal == medication_request
 
-    # The return object should be the same as input, plus 2 extra fields
+    # The return object should be the same as input, plus 3 extra fields
     assert medication_request.patient_id == patient_id
-    assert medication_request.id is None
+    assert medication_request.id == 7
+    assert medication_request.version == 1
     for key, value in medication_request_input.model_dump().items():
         assert value == getattr(medication_request, key)
 
@@ -114,3 +136,465 @@ async def test_get_invalid_medication_request_db(async_session):
         with pytest.raises(crud.ResourceNotFoundError) as exc:
             await crud.read_medication_request(db_session, 8789385, 123)
         assert exc.value.resource_class == Patient
+
+
+@pytest.mark.asyncio
+async def test_read_medication_request_errors_db(async_session):
+    """Check the error semantics of the single-statement read."""
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_patient(2, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        await db_session.commit()
+        medication_request_input = MedicationRequestInput(
+            **data.valid_medication_request_input.model_dump())
+        medication_request_input.clinician_id = 3
+        medication_request_input.medication_id = 4
+        medication_request = await crud.create_medication_request(
+            db_session, medication_request_input, 1)
+
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.read_medication_request(
+                db_session, medication_request.id, 5)
+        assert exc.value.resource_class == Patient
+
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.read_medication_request(db_session, 8789385, 1)
+        assert exc.value.resource_class == MedicationRequest
+
+        with pytest.raises(crud.PatientIDMismatchError):
+            await crud.read_medication_request(
+                db_session, medication_request.id, 2)
+
+        result = await crud.read_medication_request(
+            db_session, medication_request.id, 1)
+        assert result.id == medication_request.id
+        assert result.medication.code_name == "Oxamniquine"
+        assert result.clinician.last_name == "Smith"
+
+
+@pytest.mark.asyncio
+async def test_read_filtered_medication_requests_pages_db(async_session):
+    """Page through a collection with keyset cursors."""
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        ids = [10, 11, 12, 13, 14]
+        for id, day in zip(ids, [5, 3, 5, 1, 4]):
+            await data.add_medication_request(
+                id, 1, 3, 4, db_session, prescribed_date=date(2024, 1, day))
+        expected_order = [13, 11, 14, 10, 12]
+
+        all_results, next_cursor = (
+            await crud.read_filtered_medication_requests(
+                db_session, 1, MedicationRequestQueryParams()))
+        assert [x.id for x in all_results] == expected_order
+        assert next_cursor is None
+        assert all(isinstance(x, MedicationRequestOutput)
+                   for x in all_results)
+        assert (all_results[0].status
+                == data.valid_medication_request_input.status)
+        assert all_results[0].medication.code_name == "Oxamniquine"
+
+        paged_ids = []
+        cursor = None
+        for _ in range(3):
+            page, cursor = await crud.read_filtered_medication_requests(
+                db_session, 1,
+                MedicationRequestQueryParams(limit=2, cursor=cursor))
+            paged_ids.extend(x.id for x in page)
+            if cursor is None:
+                break
+        assert paged_ids == expected_order
+        assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_read_filtered_medication_requests_filters_db(async_session):
+    """Each filter shape has one statement, reused with new values."""
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        for id, day, status in [(10, 1, "active"), (11, 2, "completed"),
+                                (12, 3, "active"), (13, 4, "active")]:
+            await data.add_medication_request(
+                id, 1, 3, 4, db_session, prescribed_date=date(2024, 1, day),
+                status=MedicationRequestStatus(status))
+
+        async def read_ids(**params):
+            results, _ = await crud.read_filtered_medication_requests(
+                db_session, 1, MedicationRequestQueryParams(**params))
+            return [x.id for x in results]
+
+        crud._filtered_statement.cache_clear()
+        assert await read_ids(status="active") == [10, 12, 13]
+        assert await read_ids(status="completed") == [11]
+        assert await read_ids(filter_start_date=date(2024, 1, 2),
+                              filter_end_date=date(2024, 1, 3)) == [11, 12]
+        assert await read_ids(filter_start_date=date(2024, 1, 3),
+                              filter_end_date=date(2024, 1, 4)) == [12, 13]
+        info = crud._filtered_statement.cache_info()
+        assert (info.misses, info.hits) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_stream_filtered_medication_requests_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        for id, day in zip([10, 11, 12], [5, 3, 4]):
+            await data.add_medication_request(
+                id, 1, 3, 4, db_session, prescribed_date=date(2024, 1, day))
+        session_maker = async_sessionmaker(db_session.bind)
+
+        with pytest.raises(crud.ResourceNotFoundError):
+            await crud.stream_filtered_medication_requests(
+                db_session, session_maker, 2, MedicationRequestQueryParams())
+
+        stream = await crud.stream_filtered_medication_requests(
+            db_session, session_maker, 1, MedicationRequestQueryParams(
+                limit=1))
+        streamed = [x async for x in stream]
+        assert [x.id for x in streamed] == [11, 12, 10]
+        assert streamed[0].medication.code_name == "Oxamniquine"
+
+
+@pytest.mark.asyncio
+async def test_id_exists_cache():
+    db = MockAsyncContext()
+    db.execute.return_value.scalar.return_value = False
+    assert not await crud.id_exists(db, 7, Patient)
+    assert not await crud.id_exists(db, 7, Patient)
+    assert db.execute.await_count == 2  # misses are not cached
+
+    db.execute.return_value.scalar.return_value = True
+    assert await crud.id_exists(db, 7, Patient)
+    assert await crud.id_exists(db, 7, Patient)
+    assert db.execute.await_count == 3  # the second check was cached
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_commits():
+    db = MockAsyncContext()
+    db.execute.return_value.scalar.return_value = True
+    db.in_transaction.side_effect = [False, True]  # autobegun by the query
+    assert await crud.id_exists(db, 7, Patient)
+    db.commit.assert_awaited_once()
+    db.rollback.assert_not_awaited()
+    assert db.info == {}
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_rolls_back():
+    db = MockAsyncContext()
+    db.execute.side_effect = RuntimeError
+    db.in_transaction.side_effect = [False, True]
+    with pytest.raises(RuntimeError):
+        await crud.id_exists(db, 7, Patient)
+    db.rollback.assert_awaited_once()
+    db.commit.assert_not_awaited()
+    assert db.info == {}
+
+
+@pytest.mark.asyncio
+async def test_id_exists_not_cached_for_sharded_patients():
+    db = MockAsyncContext()
+    db.execute.return_value.scalar.return_value = True
+    with patch.object(settings, "DATABASE_SHARD_URLS", ("shard-1",)):
+        assert await crud.id_exists(db, 7, Patient)
+        assert await crud.id_exists(db, 7, Patient)
+        assert db.execute.await_count == 2  # a patient can be moved
+        assert await crud.id_exists(db, 7, Clinician)
+        assert await crud.id_exists(db, 7, Clinician)
+        assert db.execute.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_read_versions_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_patient(2, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        for id in [10, 11, 12]:
+            await data.add_medication_request(id, 1, 3, 4, db_session)
+
+        assert await crud.read_medication_request_version(
+            db_session, 11, 1) == 1
+        with pytest.raises(crud.PatientIDMismatchError):
+            await crud.read_medication_request_version(db_session, 11, 2)
+        with pytest.raises(crud.ResourceNotFoundError):
+            await crud.read_medication_request_version(db_session, 99, 1)
+
+        versions, has_next = (
+            await crud.read_filtered_medication_request_versions(
+                db_session, 1, MedicationRequestQueryParams(limit=2)))
+        assert versions == [(10, 1), (11, 1)]
+        assert has_next
+
+
+@pytest.mark.asyncio
+async def test_create_medication_requests_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_clinician(2, db_session)
+        await data.add_medication(3, db_session)
+        await db_session.commit()
+
+        inputs = []
+        for clinician_id, medication_id in [(2, 3), (99, 3), (2, 99), (2, 3)]:
+            medication_request_input = MedicationRequestInput(
+                **data.valid_medication_request_input.model_dump())
+            medication_request_input.clinician_id = clinician_id
+            medication_request_input.medication_id = medication_id
+            inputs.append(medication_request_input)
+
+        results = await crud.create_medication_requests(db_session, inputs, 1)
+
+        assert len(results) == 4
+        assert isinstance(results[0], MedicationRequest)
+        assert isinstance(results[3], MedicationRequest)
+        assert results[0].id != results[3].id
+        assert results[0].patient_id == 1
+        assert results[0].version == 1
+        assert isinstance(results[1], crud.ResourceNotFoundError)
+        assert results[1].resource_class.__name__ == "Clinician"
+        assert isinstance(results[2], crud.ResourceNotFoundError)
+        assert results[2].resource_class.__name__ == "Medication"
+
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert [x.id for x in items] == [results[0].id, results[3].id]
+        await db_session.commit()
+
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.create_medication_requests(db_session, inputs, 5)
+        assert exc.value.resource_class == Patient
+
+
+@pytest.mark.asyncio
+async def test_update_medication_request_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_patient(2, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        await data.add_medication_request(10, 1, 3, 4, db_session)
+        await db_session.commit()
+
+        statements = []
+
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        engine = db_session.bind.sync_engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            patch_data = MedicationRequestPatch(
+                end_date=date(2025, 1, 1), frequency="hourly",
+                status=MedicationRequestStatus.COMPLETED)
+            updated = await crud.update_medication_request(
+                db_session, patch_data, 10, 1)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert isinstance(updated, MedicationRequestOutput)
+        assert updated.version == 2
+        assert updated.frequency == "hourly"
+        assert updated.status == MedicationRequestStatus.COMPLETED
+        assert updated.end_date == date(2025, 1, 1)
+        # One UPDATE ... RETURNING, and the cached names
+        assert len([x for x in statements if x.startswith("UPDATE")]) == 1
+        assert not [x for x in statements if x.startswith("SELECT")
+                    and "medicationrequest" in x]
+        await db_session.commit()
+
+        with pytest.raises(crud.PatientIDMismatchError):
+            await crud.update_medication_request(db_session, patch_data,
+                                                 10, 2)
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.update_medication_request(db_session, patch_data,
+                                                 99, 1)
+        assert exc.value.resource_class == MedicationRequest
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.update_medication_request(db_session, patch_data,
+                                                 10, 5)
+        assert exc.value.resource_class == Patient
+
+
+@pytest.mark.asyncio
+async def test_update_medication_request_version_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_patient(2, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        await data.add_medication_request(10, 1, 3, 4, db_session)
+        await db_session.commit()
+        patch_data = MedicationRequestPatch(
+            frequency="hourly", status=MedicationRequestStatus.ACTIVE)
+
+        updated = await crud.update_medication_request(
+            db_session, patch_data, 10, 1, [1])
+        assert updated.version == 2
+        await db_session.commit()
+
+        with pytest.raises(crud.VersionConflictError):
+            await crud.update_medication_request(
+                db_session, patch_data, 10, 1, [1])
+        # Ownership and existence errors take precedence
+        with pytest.raises(crud.PatientIDMismatchError):
+            await crud.update_medication_request(
+                db_session, patch_data, 10, 2, [1])
+        with pytest.raises(crud.ResourceNotFoundError):
+            await crud.update_medication_request(
+                db_session, patch_data, 99, 1, [1])
+        assert (await crud.read_medication_request_version(
+            db_session, 10, 1)) == 2
+
+
+@pytest.mark.asyncio
+async def test_transition_medication_requests_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_patient(2, db_session)
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+        statuses = {10: MedicationRequestStatus.ACTIVE,
+                    11: MedicationRequestStatus.ON_HOLD,
+                    12: MedicationRequestStatus.CANCELLED,
+                    13: MedicationRequestStatus.ACTIVE}
+        for id, status in statuses.items():
+            await data.add_medication_request(
+                id, 1, 3, 4, db_session, status=status,
+                prescribed_date=date(2024, 1, id))
+        await data.add_medication_request(20, 2, 3, 4, db_session)
+        await db_session.commit()
+
+        ids = await crud.transition_medication_requests(
+            db_session, MedicationRequestTransition(
+                from_statuses=[MedicationRequestStatus.ACTIVE,
+                               MedicationRequestStatus.ON_HOLD],
+                filter_start_date=date(2024, 1, 1),
+                filter_end_date=date(2024, 1, 12),
+                status=MedicationRequestStatus.COMPLETED), 1)
+        assert ids == [10, 11]
+
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert {x.id: (x.status, x.version) for x in items} == {
+            10: (MedicationRequestStatus.COMPLETED, 2),
+            11: (MedicationRequestStatus.COMPLETED, 2),
+            12: (MedicationRequestStatus.CANCELLED, 1),
+            13: (MedicationRequestStatus.ACTIVE, 1)}
+        await db_session.commit()
+
+        # Requests already in the new status are not changed
+        ids = await crud.transition_medication_requests(
+            db_session, MedicationRequestTransition(
+                status=MedicationRequestStatus.COMPLETED), 1)
+        assert ids == [12, 13]
+
+        with pytest.raises(crud.ResourceNotFoundError) as exc:
+            await crud.transition_medication_requests(
+                db_session, MedicationRequestTransition(
+                    status=MedicationRequestStatus.COMPLETED), 5)
+        assert exc.value.resource_class == Patient
+
+
+@pytest.mark.asyncio
+async def test_create_idempotent_medication_request_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        await data.add_clinician(2, db_session)
+        await data.add_medication(3, db_session)
+        await db_session.commit()
+        medication_request_input = MedicationRequestInput(
+            **data.valid_medication_request_input.model_dump())
+        medication_request_input.clinician_id = 2
+        medication_request_input.medication_id = 3
+
+        record, replayed = await crud.create_idempotent_medication_request(
+            db_session, medication_request_input, 1, "key-1")
+        assert not replayed
+        created = MedicationRequest.model_validate_json(record.response_body)
+        assert created.id == record.medication_request_id
+        assert created.patient_id == 1
+
+        again, replayed = await crud.create_idempotent_medication_request(
+            db_session, medication_request_input, 1, "key-1")
+        assert replayed
+        assert again.response_body == record.response_body
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert len(items) == 1
+        await db_session.commit()
+
+        # A concurrent retry, which missed the key before inserting, fails
+        # on the key, rolls back and replays the stored result
+        read_key = crud._read_idempotency_key
+        misses = [None]
+
+        async def read_key_after_miss(*args):
+            return misses.pop() if misses else await read_key(*args)
+
+        with patch('app.crud._read_idempotency_key',
+                   side_effect=read_key_after_miss):
+            again, replayed = (
+                await crud.create_idempotent_medication_request(
+                    db_session, medication_request_input, 1, "key-1"))
+        assert replayed
+        assert again.response_body == record.response_body
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert len(items) == 1
+        await db_session.commit()
+
+        medication_request_input.frequency = "hourly"
+        with pytest.raises(crud.IdempotencyKeyReuseError):
+            await crud.create_idempotent_medication_request(
+                db_session, medication_request_input, 1, "key-1")
+
+        # A failed request does not store the key
+        medication_request_input.medication_id = 99
+        with pytest.raises(crud.ResourceNotFoundError):
+            await crud.create_idempotent_medication_request(
+                db_session, medication_request_input, 1, "key-2")
+        assert await db_session.get(IdempotencyKey, "key-2") is None
+        await db_session.commit()
+
+        # An expired key is deleted, and can then be used again
+        record = await db_session.get(IdempotencyKey, "key-1")
+        record.created_at -= timedelta(days=2)
+        await db_session.commit()
+        assert await crud.delete_expired_idempotency_keys(db_session) == 1
+        medication_request_input.medication_id = 3
+        record, replayed = await crud.create_idempotent_medication_request(
+            db_session, medication_request_input, 1, "key-1")
+        assert not replayed
+        assert record.created_at > datetime.now() - timedelta(days=1)
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_releases_connection_db(async_session):
+    async for db_session in async_session:
+        await data.add_patient(1, db_session)
+        db = AsyncSession(db_session.bind)  # as a request's session
+
+        assert await crud.id_exists(db, 1, Patient)
+        assert not db.in_transaction()  # connection returned to the pool
+
+        with pytest.raises(crud.ResourceNotFoundError):
+            await crud.read_medication_request(db, 10, 1)
+        assert not db.in_transaction()
+        assert "in_crud_call" not in db.info
+
+        async with db.begin():
+            await crud.read_filtered_medication_requests(
+                db, 1, MedicationRequestQueryParams())
+            assert db.in_transaction()  # the caller's is left open
+        await db.close()
@@ -5,24 +5,32 @@ from unittest.mock import patch
 from contextlib import asynccontextmanager
 
 import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import settings
 from app.database import Database
 
 TEST_DATABASE_FILENAME = "test_database.db"
 
 
+def remove_database_files(test_filename: str):
+    for filename in (test_filename, f"{test_filename}-wal",
+                     f"{test_filename}-shm"):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
 @asynccontextmanager
 async def set_database_url(test_filename: str):
-    if os.path.exists(test_filename):
-        os.remove(test_filename)
+    remove_database_files(test_filename)
     os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{test_filename}"
     try:
         yield
     finally:
         del os.environ["DATABASE_URL"]
-        if os.path.exists(test_filename):
-            os.remove(test_filename)
+        remove_database_files(test_filename)
 
 
 @pytest.mark.asyncio
@@ -31,7 +39,62 @@ async def test_get_db():
         async with set_database_url(TEST_DATABASE_FILENAME):
             await Database.init_db()
 
-    db_gen = Database.get_db()
+    db_gen = Database.get_db(1)
     # Retrieve the session from the async generator
     session = await db_gen.__anext__()
     assert isinstance(session, AsyncSession)
+    await Database.close_db()
+
+
+@pytest.mark.asyncio
+async def test_get_read_db_without_replicas():
+    with patch('sqlmodel.SQLModel.metadata.create_all'):
+        async with set_database_url(TEST_DATABASE_FILENAME):
+            await Database.init_db()
+
+    assert Database.replicas.replicas == []
+    session = await Database.get_read_db(1).__anext__()
+    assert isinstance(session, AsyncSession)
+    assert session.bind is Database.read_shards[0].kw["bind"]
+    await Database.close_db()
+
+
+@pytest.mark.asyncio
+async def test_get_db_sharded(tmp_path):
+    shard_url = f"sqlite+aiosqlite:///{tmp_path / 'shard1.db'}"
+    with patch.object(settings, 'DATABASE_SHARD_URLS', (shard_url,)):
+        async with set_database_url(TEST_DATABASE_FILENAME):
+            await Database.init_db()
+            await Database.create_all()
+            assert len(Database.shards) == 2
+            session = await Database.get_db(3).__anext__()
+            assert session.bind is Database.shard_engines[1]
+            session = await Database.get_read_db(4).__anext__()
+            assert session.bind is Database.read_shards[0].kw["bind"]
+            await Database.close_db()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile():
+    async with set_database_url(TEST_DATABASE_FILENAME):
+        await Database.init_db()
+        await Database.create_all()
+        writer = Database.engine
+        reader = Database.read_shards[0].kw["bind"]
+        assert writer.pool.size() == 1
+        assert await Database.read_session_maker_for(1) is (
+            Database.read_shards[0])
+        assert reader.pool.size() == settings.SQLITE_READER_POOL_SIZE
+        async with writer.connect() as conn:
+            assert (await conn.execute(
+                text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(
+                text("PRAGMA foreign_keys"))).scalar() == 1
+            assert (await conn.execute(
+                text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+        async with reader.connect() as conn:
+            assert (await conn.execute(
+                text("PRAGMA query_only"))).scalar() == 1
+            with pytest.raises(OperationalError):
+                await conn.execute(text("DELETE FROM patient"))
+        await Database.close_db()
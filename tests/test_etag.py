@@ -0,0 +1,38 @@
+"""Tests for the etag.py module."""
+
+from app.etag import (
+    version_etag, collection_etag, none_match, if_match_versions
+)
+from app.models.medication_request import MedicationRequestQueryParams
+
+
+def test_version_etag():
+    assert version_etag(3) == '"3"'
+    assert none_match(None, '"3"')
+    assert none_match('"2"', '"3"')
+    assert not none_match('"3"', '"3"')
+    assert not none_match('"1", W/"3"', '"3"')
+    assert not none_match('*', '"3"')
+
+
+def test_collection_etag():
+    query_params = MedicationRequestQueryParams(limit=2)
+    etag = collection_etag(query_params, [(1, 1), (2, 1)], False)
+    assert etag == collection_etag(
+        MedicationRequestQueryParams(limit=2), [(1, 1), (2, 1)], False)
+    assert etag.startswith('"') and etag.endswith('"')
+    different = [
+        collection_etag(query_params, [(1, 1), (2, 2)], False),
+        collection_etag(query_params, [(1, 1), (3, 1)], False),
+        collection_etag(query_params, [(1, 1), (2, 1)], True),
+        collection_etag(MedicationRequestQueryParams(limit=3),
+                        [(1, 1), (2, 1)], False)]
+    assert etag not in different
+
+
+def test_if_match_versions():
+    assert if_match_versions('"3"') == [3]
+    assert if_match_versions('"3", "5"') == [3, 5]
+    assert if_match_versions('*') is None
+    assert if_match_versions('W/"3"') == []
+    assert if_match_versions('"abc", 3') == []
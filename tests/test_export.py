@@ -0,0 +1,91 @@
+"""Tests for the export.py module and the export command."""
+
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import export
+from app.commands import export as export_command
+from . import data
+from .sqlite_setup import DATABASE_FILE
+
+
+async def add_rows(db_session):
+    await data.add_patient(1, db_session)
+    await data.add_patient(2, db_session)
+    await data.add_clinician(3, db_session)
+    await data.add_medication(4, db_session)
+    for id in range(10, 15):
+        await data.add_medication_request(id, 1, 3, 4, db_session)
+    await data.add_medication_request(20, 2, 3, 4, db_session)
+    await db_session.commit()
+
+
+async def collect(iterator) -> list:
+    return [x async for x in iterator]
+
+
+@pytest.mark.asyncio
+async def test_export_rows_db(async_session):
+    async for db_session in async_session:
+        await add_rows(db_session)
+        session_maker = async_sessionmaker(db_session.bind)
+
+        chunks = await collect(export.export_rows(session_maker, 1, 2))
+        assert [len(x) for x in chunks] == [2, 2, 1]
+        row = dict(zip(export.COLUMNS, chunks[0][0]))
+        assert row["id"] == 10
+        assert row["medication_code_name"] == "Oxamniquine"
+        assert row["clinician_first_name"] == "John"
+
+        chunks = await collect(export.export_rows(session_maker, None, 3))
+        assert [len(x) for x in chunks] == [3, 3]
+        assert chunks[1][-1][export.COLUMNS.index("id")] == 20
+        assert await collect(export.export_rows(session_maker, 5)) == []
+
+
+@pytest.mark.asyncio
+async def test_export_bytes_db(async_session):
+    async for db_session in async_session:
+        await add_rows(db_session)
+        session_maker = async_sessionmaker(db_session.bind)
+
+        jsonl = b"".join(await collect(export.export_bytes(
+            session_maker, 1, "jsonl", chunk_size=2)))
+        lines = [json.loads(x) for x in jsonl.splitlines()]
+        assert [x["id"] for x in lines] == [10, 11, 12, 13, 14]
+        assert lines[0]["status"] == data.valid_medication_request.status
+        assert lines[0]["prescribed_date"] == (
+            data.valid_medication_request.prescribed_date.isoformat())
+
+        csv_data = b"".join(await collect(export.export_bytes(
+            session_maker, 1, "csv", chunk_size=2)))
+        rows = list(csv.DictReader(io.StringIO(csv_data.decode())))
+        assert [int(x["id"]) for x in rows] == [10, 11, 12, 13, 14]
+        assert rows[0]["clinician_last_name"] == "Smith"
+
+        compressed = b"".join(await collect(export.export_bytes(
+            session_maker, 1, "csv", True, chunk_size=2)))
+        assert gzip.decompress(compressed) == csv_data
+
+        empty = b"".join(await collect(export.export_bytes(
+            session_maker, 5, "csv", True)))
+        assert gzip.decompress(empty).decode().startswith("id,")
+
+
+@pytest.mark.asyncio
+async def test_export_command_db(async_session, tmp_path, monkeypatch):
+    async for db_session in async_session:
+        await add_rows(db_session)
+        monkeypatch.setenv("DATABASE_URL",
+                           f"sqlite+aiosqlite:///{DATABASE_FILE}")
+        output = tmp_path / "export.jsonl.gz"
+
+        await export_command.main(["--gzip", "--output", str(output)])
+
+        lines = gzip.decompress(output.read_bytes()).splitlines()
+        assert len(lines) == 6
@@ -0,0 +1,85 @@
+"""Tests for the import_jsonl.py command."""
+
+import io
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import crud
+from app.commands import import_jsonl
+from app.models.medication_request import MedicationRequestQueryParams
+from . import data
+from .sqlite_setup import DATABASE_FILE
+
+
+def make_line(**changes) -> str:
+    record = json.loads(data.valid_medication_request_input.model_dump_json())
+    return json.dumps(record | {"patient_id": 1, "clinician_id": 2,
+                                "medication_id": 3} | changes)
+
+
+LINES = [make_line(), "not json", make_line(frequency=""), "",
+         make_line(clinician_id=99), make_line(), make_line()]
+
+
+async def add_references(db_session):
+    await data.add_patient(1, db_session)
+    await data.add_clinician(2, db_session)
+    await data.add_medication(3, db_session)
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_import_medication_requests_db(async_session):
+    async for db_session in async_session:
+        await add_references(db_session)
+        rejects = io.StringIO()
+
+        progress = await import_jsonl.import_medication_requests(
+            async_sessionmaker(db_session.bind), LINES, batch_size=2,
+            rejects=rejects)
+
+        assert progress.imported == 3
+        assert progress.rejected == 3
+        assert "rows/s" in str(progress)
+        assert [json.loads(x)["line"]
+                for x in rejects.getvalue().splitlines()] == [2, 3, 5]
+        items, _ = await crud.read_filtered_medication_requests(
+            db_session, 1, MedicationRequestQueryParams())
+        assert len(items) == 3
+        assert items[0].version == 1
+
+
+@pytest.mark.asyncio
+async def test_import_rejects_invalid_dates_db(async_session):
+    async for db_session in async_session:
+        await add_references(db_session)
+        rejects = io.StringIO()
+
+        progress = await import_jsonl.import_medication_requests(
+            async_sessionmaker(db_session.bind),
+            [make_line(end_date="2024-01-01"), make_line()], rejects=rejects)
+
+        assert progress.imported == 1
+        assert progress.rejected == 1
+        assert json.loads(rejects.getvalue()) == {
+            "line": 1,
+            "error": "End date must be after the start date, or None."}
+
+
+@pytest.mark.asyncio
+async def test_main_db(async_session, tmp_path, monkeypatch, capsys):
+    async for db_session in async_session:
+        await add_references(db_session)
+        input_file = tmp_path / "input.jsonl"
+        input_file.write_text("\n".join(LINES), encoding="utf-8")
+        rejects_file = tmp_path / "rejects.jsonl"
+        monkeypatch.setenv("DATABASE_URL",
+                           f"sqlite+aiosqlite:///{DATABASE_FILE}")
+
+        await import_jsonl.main([str(input_file), "--batch-size", "3",
+                                 "--rejects", str(rejects_file)])
+
+        assert "Done: 3 imported, 3 rejected" in capsys.readouterr().err
+        assert len(rejects_file.read_text().splitlines()) == 3
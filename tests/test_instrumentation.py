@@ -0,0 +1,97 @@
+"""Tests for the instrumentation.py module."""
+
+import importlib
+import logging
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import instrumentation, settings
+
+
+@pytest.mark.parametrize("value, echo", [
+    (None, False), ("0", False), ("", False), ("1", True)])
+def test_database_echo_setting(monkeypatch, value, echo):
+    if value is None:
+        monkeypatch.delenv("DATABASE_ECHO", raising=False)
+    else:
+        monkeypatch.setenv("DATABASE_ECHO", value)
+    try:
+        assert importlib.reload(settings).DATABASE_ECHO is echo
+    finally:
+        monkeypatch.undo()
+        importlib.reload(settings)
+
+
+def make_app(server_timing: bool) -> FastAPI:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrumentation.instrument(engine)
+    app = FastAPI()
+    app.add_middleware(instrumentation.QueryStatsMiddleware,
+                       server_timing=server_timing)
+
+    @app.get("/items/{count}")
+    async def run_statements(count: int):
+        async with engine.connect() as conn:
+            for _ in range(count):
+                await conn.execute(text("SELECT 1"))
+        return {}
+
+    return app
+
+
+def test_request_statements():
+    before = instrumentation.request_statements.count("/items/{count}")
+    client = TestClient(make_app(server_timing=True))
+
+    response = client.get("/items/3")
+
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert response.headers["Server-Timing"].endswith(
+        'desc="3 statements"')
+    assert instrumentation.request_statements.count(
+        "/items/{count}") == before + 1
+
+
+def test_no_server_timing():
+    response = TestClient(make_app(server_timing=False)).get("/items/1")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+def test_slow_query_log(caplog):
+    client = TestClient(make_app(server_timing=False))
+    with patch.object(settings, "SLOW_QUERY_SECONDS", 0.0):
+        with caplog.at_level(logging.WARNING, instrumentation.__name__):
+            client.get("/items/1")
+    assert "Slow SQL statement" in caplog.text
+    assert "SELECT 1" in caplog.text
+    caplog.clear()
+    client.get("/items/1")
+    assert "Slow SQL statement" not in caplog.text
+
+
+def test_compiled_cache_counts():
+    instrumentation._compiled_cache.clear()
+    client = TestClient(make_app(server_timing=False))
+    client.get("/items/3")
+    assert instrumentation._compiled_cache == {"cache_miss": 1,
+                                               "cache_hit": 2}
+
+
+@pytest.mark.asyncio
+async def test_failed_statement():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrumentation.instrument(engine)
+    count = instrumentation.statement_seconds.count()
+    async with engine.connect() as conn:
+        with pytest.raises(exc.OperationalError):
+            await conn.execute(text("SELECT * FROM missing"))
+        await conn.execute(text("SELECT 1"))
+        assert "statement_start" not in conn.sync_connection.info
+    assert instrumentation.statement_seconds.count() == count + 1
+    await engine.dispose()
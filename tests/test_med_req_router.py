@@ -1,7 +1,7 @@
 """Tests for the medication request router, with mocked database CRUD."""
 
-from datetime import date
-from unittest.mock import patch, AsyncMock
+from datetime import date, datetime
+from unittest.mock import patch, AsyncMock, Mock
 import json
 
 import pytest
@@ -12,8 +12,11 @@ from app.models.types import MedicationRequestStatus
 from app.models.medication_request import MedicationRequest
 from app.models.medication_request import MedicationRequestOutput
 from app.models.medication_request import MedicationRequestInput
+from app.models.idempotency_key import IdempotencyKey
 from app import settings
 from app.database import Database
+from app import crud
+from . import data
 
 client = TestClient(app)
 
@@ -22,6 +25,7 @@ mock_db_session = AsyncMock()
 async def get_db():  # noqa
     yield mock_db_session
 app.dependency_overrides[Database.get_db] = get_db
+app.dependency_overrides[Database.get_read_db] = get_db
 
 # Mock a MedicationRequest object obtained from the database.
 medication = AsyncMock(code_name="caffeine")
@@ -115,3 +119,369 @@ async def test_post_medication_request():
         input_json = mock_medication_request.model_dump_json()
         assert (MedicationRequest(**json.loads(input_json))
                 == MedicationRequest(**response.json()))
+
+
+@pytest.mark.asyncio
+async def test_get_medication_requests_next_cursor():
+    with patch(
+            'app.crud.read_filtered_medication_requests',
+            new_callable=AsyncMock) as mock_read_filtered:
+        mock_read_filtered.return_value = (
+            [mock_medication_request], "next-page")
+
+        response = client.get(
+            f"/{settings.PATIENT_URL_PREFIX}"
+            f"/{mock_medication_request.patient_id}"
+            f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}",
+            params={"limit": 1})
+
+        assert response.status_code == 200
+        assert response.headers[settings.NEXT_CURSOR_HEADER] == "next-page"
+        assert len(response.json()) == 1
+        query_params = mock_read_filtered.await_args.args[2]
+        assert query_params.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_get_medication_requests_last_page():
+    with patch(
+            'app.crud.read_filtered_medication_requests',
+            new_callable=AsyncMock) as mock_read_filtered:
+        mock_read_filtered.return_value = ([mock_medication_request], None)
+
+        response = client.get(
+            f"/{settings.PATIENT_URL_PREFIX}"
+            f"/{mock_medication_request.patient_id}"
+            f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}")
+
+        assert response.status_code == 200
+        assert settings.NEXT_CURSOR_HEADER not in response.headers
+        assert len(response.json()) == 1
+        query_params = mock_read_filtered.await_args.args[2]
+        assert query_params.limit == settings.MEDICATION_REQUESTS_DEFAULT_LIMIT
+
+
+async def stream_of(*items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_stream_medication_requests():
+    url = (f"/{settings.PATIENT_URL_PREFIX}"
+           f"/{mock_medication_request.patient_id}"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}/stream")
+    reader = Mock()
+    with patch(
+            'app.crud.stream_filtered_medication_requests',
+            new_callable=AsyncMock) as mock_stream, \
+            patch.object(Database, 'shards', [None], create=True), \
+            patch.object(Database, 'read_shards', [reader], create=True):
+        mock_stream.return_value = stream_of(
+            data.valid_medication_request, data.valid_medication_request)
+        response = client.get(url)
+        assert response.status_code == 200
+        assert mock_stream.call_args.args[1] is reader
+        assert response.headers["content-type"].startswith(
+            settings.NDJSON_MEDIA_TYPE)
+        lines = response.text.splitlines()
+        assert len(lines) == 2
+        for line in lines:
+            assert (MedicationRequestOutput.model_validate_json(line)
+                    == data.valid_medication_request)
+
+        mock_stream.return_value = stream_of(data.valid_medication_request)
+        response = client.get(
+            url, headers={"Accept": settings.JSON_MEDIA_TYPE})
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+
+        mock_stream.return_value = stream_of()
+        response = client.get(
+            url, headers={"Accept": settings.JSON_MEDIA_TYPE})
+        assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_get_medication_request_not_modified():
+    url = (f"/{settings.PATIENT_URL_PREFIX}"
+           f"/{mock_medication_request.patient_id}"
+           f"/{settings.MEDICATION_REQUEST_URL_PREFIX}"
+           f"/{mock_medication_request.id}")
+    with patch('app.crud.read_medication_request',
+               new_callable=AsyncMock) as mock_read, \
+            patch('app.crud.read_medication_request_version',
+                  new_callable=AsyncMock) as mock_read_version:
+        mock_read.return_value = mock_medication_request
+        mock_read_version.return_value = mock_medication_request.version
+
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        mock_read_version.assert_not_awaited()
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+        mock_read.assert_awaited_once()
+
+        mock_read_version.return_value = mock_medication_request.version + 1
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert mock_read.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_medication_requests_not_modified():
+    url = (f"/{settings.PATIENT_URL_PREFIX}"
+           f"/{mock_medication_request.patient_id}"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}")
+    with patch('app.crud.read_filtered_medication_requests',
+               new_callable=AsyncMock) as mock_read, \
+            patch('app.crud.read_filtered_medication_request_versions',
+                  new_callable=AsyncMock) as mock_read_versions:
+        mock_read.return_value = ([mock_medication_request], None)
+        mock_read_versions.return_value = (
+            [(mock_medication_request.id, mock_medication_request.version)],
+            False)
+
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        mock_read.assert_awaited_once()
+
+        mock_read_versions.return_value = ([], False)
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_get_medication_requests_fast_serialization():
+    with patch(
+            'app.crud.read_filtered_medication_requests',
+            new_callable=AsyncMock) as mock_read_filtered, \
+            patch.object(settings, 'FAST_SERIALIZATION', True):
+        mock_read_filtered.return_value = (
+            [data.valid_medication_request], "next-page")
+
+        response = client.get(
+            f"/{settings.PATIENT_URL_PREFIX}"
+            f"/{mock_medication_request.patient_id}"
+            f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == settings.JSON_MEDIA_TYPE
+        assert response.headers[settings.NEXT_CURSOR_HEADER] == "next-page"
+        assert "ETag" in response.headers
+        assert ([MedicationRequestOutput(**x) for x in response.json()]
+                == [data.valid_medication_request])
+
+
+@pytest.mark.asyncio
+async def test_get_medication_requests_result_cache():
+    url = (f"/{settings.PATIENT_URL_PREFIX}"
+           f"/{mock_medication_request.patient_id}"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}")
+    with patch('app.crud.read_filtered_medication_requests',
+               new_callable=AsyncMock) as mock_read, \
+            patch.object(crud.result_cache, 'max_bytes', 10000):
+        mock_read.return_value = ([data.valid_medication_request], "next")
+
+        first = client.get(url)
+        second = client.get(url)
+        assert mock_read.await_count == 1
+        assert second.status_code == 200
+        assert second.content == first.content
+        assert second.headers["ETag"] == first.headers["ETag"]
+        assert second.headers[settings.NEXT_CURSOR_HEADER] == "next"
+
+        response = client.get(
+            url, headers={"If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 304
+        assert mock_read.await_count == 1
+
+        client.get(url, params={"status": "active"})
+        assert mock_read.await_count == 2
+
+        crud.result_cache.invalidate(mock_medication_request.patient_id)
+        client.get(url)
+        assert mock_read.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_post_medication_requests_bulk():
+    medication_request_input = MedicationRequestInput(
+        **data.valid_medication_request_input.model_dump())
+    url = (f"/{settings.PATIENT_URL_PREFIX}"
+           f"/{mock_medication_request.patient_id}"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}/")
+    content = json.dumps([json.loads(
+        medication_request_input.model_dump_json())] * 2)
+
+    with patch(
+            'app.crud.create_medication_requests',
+            new_callable=AsyncMock) as mock_create_medication_requests:
+        mock_create_medication_requests.return_value = [
+            mock_medication_request, mock_medication_request]
+        response = client.post(url, content=content)
+        assert response.status_code == 201
+        assert [x["status_code"] for x in response.json()] == [201, 201]
+        assert response.json()[0]["medication_request"]["id"] == 5
+        mock_create_medication_requests.assert_awaited_once_with(
+            mock_db_session, [medication_request_input] * 2,
+            mock_medication_request.patient_id)
+
+        mock_create_medication_requests.return_value = [
+            mock_medication_request,
+            crud.ResourceNotFoundError(crud.Clinician)]
+        response = client.post(url, content=content)
+        assert response.status_code == 207
+        assert response.json()[1] == {
+            "status_code": 404, "medication_request": None,
+            "detail": "The specified Clinician was not found."}
+
+    response = client.post(url, content="[]")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_patch_medication_request_if_match():
+    url = (f"/{settings.PATIENT_URL_PREFIX}/1"
+           f"/{settings.MEDICATION_REQUEST_URL_PREFIX}/10")
+    content = '{"frequency": "hourly", "status": "active"}'
+    with patch(
+            'app.crud.update_medication_request',
+            new_callable=AsyncMock) as mock_update_medication_request:
+        mock_update_medication_request.return_value = (
+            data.valid_medication_request)
+        response = client.patch(url, content=content,
+                                headers={"If-Match": '"1"'})
+        assert response.status_code == 200
+        assert response.headers["ETag"] == '"1"'
+        assert mock_update_medication_request.await_args.args[4] == [1]
+
+        response = client.patch(url, content=content)
+        assert response.status_code == 200
+        assert mock_update_medication_request.await_args.args[4] is None
+
+        mock_update_medication_request.side_effect = (
+            crud.VersionConflictError())
+        response = client.patch(url, content=content,
+                                headers={"If-Match": '"1"'})
+        assert response.status_code == 412
+
+
+@pytest.mark.asyncio
+async def test_post_medication_requests_status_transition():
+    url = (f"/{settings.PATIENT_URL_PREFIX}/1"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}/status-transition")
+    with patch(
+            'app.crud.transition_medication_requests',
+            new_callable=AsyncMock) as mock_transition_medication_requests:
+        mock_transition_medication_requests.return_value = [3, 4]
+        response = client.post(url, json={
+            "from_statuses": ["active", "on-hold"], "status": "completed"})
+        assert response.status_code == 200
+        assert response.json() == {"count": 2, "ids": [3, 4]}
+        transition = mock_transition_medication_requests.await_args.args[1]
+        assert transition.from_statuses == [
+            MedicationRequestStatus.ACTIVE, MedicationRequestStatus.ON_HOLD]
+        assert transition.status == MedicationRequestStatus.COMPLETED
+
+    response = client.post(url, json={"status": "completed",
+                                      "filter_start_date": "2024-01-01"})
+    assert response.status_code == 422
+    response = client.post(url, json={"from_statuses": [],
+                                      "status": "completed"})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_medication_request_idempotency_key():
+    url = (f"/{settings.PATIENT_URL_PREFIX}/1"
+           f"/{settings.MEDICATION_REQUEST_URL_PREFIX}")
+    record = IdempotencyKey(
+        key="abc", fingerprint="x", medication_request_id=5,
+        response_body=mock_medication_request.model_dump_json(),
+        created_at=datetime.now())
+    with patch(
+            'app.crud.create_idempotent_medication_request',
+            new_callable=AsyncMock) as mock_create:
+        for replayed in [False, True]:
+            mock_create.return_value = (record, replayed)
+            response = client.post(
+                url, headers={"Idempotency-Key": "abc"},
+                content=data.valid_medication_request_input.model_dump_json())
+            assert response.status_code == 201
+            assert response.headers["Location"].endswith(
+                f"/{settings.MEDICATION_REQUEST_URL_PREFIX}/5")
+            assert response.json() == json.loads(record.response_body)
+            assert ((settings.IDEMPOTENT_REPLAYED_HEADER in response.headers)
+                    == replayed)
+        assert mock_create.await_args.args[2:] == (1, "abc")
+
+        mock_create.side_effect = crud.IdempotencyKeyReuseError()
+        response = client.post(
+            url, headers={"Idempotency-Key": "abc"},
+            content=data.valid_medication_request_input.model_dump_json())
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_post_medication_request_coalesced():
+    writer = AsyncMock()
+    writer.create_medication_request.return_value = mock_medication_request
+    with patch('app.coalescer.writers', [writer]), \
+            patch.object(Database, 'shards', [None], create=True):
+        response = client.post(
+            f"/{settings.PATIENT_URL_PREFIX}/1"
+            f"/{settings.MEDICATION_REQUEST_URL_PREFIX}",
+            content=data.valid_medication_request_input.model_dump_json())
+    assert response.status_code == 201
+    assert response.headers["Location"].endswith(
+        f"/{settings.MEDICATION_REQUEST_URL_PREFIX}/5")
+    writer.create_medication_request.assert_awaited_once_with(
+        data.valid_medication_request_input, 1)
+
+
+@pytest.mark.asyncio
+async def test_export_medication_requests():
+    url = (f"/{settings.PATIENT_URL_PREFIX}/1"
+           f"/{settings.MEDICATION_REQUESTS_URL_PREFIX}/export")
+
+    async def chunks(*_args):
+        yield b"id,status\n"
+        yield b"1,active\n"
+
+    reader = Mock()
+    with patch('app.export.export_bytes', side_effect=chunks) as mock_export, \
+            patch.object(Database, 'shards', [None], create=True), \
+            patch.object(Database, 'read_shards', [reader], create=True):
+        with patch('app.crud.id_exists', new_callable=AsyncMock,
+                   return_value=True):
+            response = client.get(url, params={"format": "csv",
+                                               "gzip": "true"})
+            assert response.status_code == 200
+            assert response.headers["Content-Type"] == (
+                settings.GZIP_MEDIA_TYPE)
+            assert response.headers["Content-Disposition"] == (
+                'attachment; filename="medication-requests-1.csv.gz"')
+            assert response.content == b"id,status\n1,active\n"
+            assert mock_export.call_args.args == (reader, 1, "csv", True)
+
+            response = client.get(url)
+            assert response.headers["Content-Type"] == (
+                settings.NDJSON_MEDIA_TYPE)
+            assert response.status_code == 200
+
+            response = client.get(url, params={"format": "xml"})
+            assert response.status_code == 422
+
+        with patch('app.crud.id_exists', new_callable=AsyncMock,
+                   return_value=False):
+            response = client.get(url)
+            assert response.status_code == 404
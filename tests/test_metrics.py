@@ -0,0 +1,50 @@
+"""Tests for the metrics.py module and the metrics endpoint."""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Histogram, Registry
+
+
+def test_histogram():
+    histogram = Histogram("latency_seconds", "Latency", "pool",
+                          buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value, "a")
+    assert histogram.count("a") == 4
+    assert histogram.count("b") == 0
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{pool="a",le="0.1"} 2',
+        'latency_seconds_bucket{pool="a",le="1.0"} 3',
+        'latency_seconds_bucket{pool="a",le="+Inf"} 4',
+        'latency_seconds_sum{pool="a"} 2.65',
+        'latency_seconds_count{pool="a"} 4']
+    histogram.clear()
+    assert histogram.count("a") == 0
+
+
+def test_registry():
+    registry = Registry()
+    registry.gauge("size", "The size", lambda: 3)
+    registry.counter("hits_total", "The hits", lambda: {"x": 1, "y": 2},
+                     "cache")
+    registry.histogram("wait_seconds", "The wait").observe(0.001)
+    assert registry.histogram("wait_seconds", "") is registry.histogram(
+        "wait_seconds", "")
+    text = registry.render()
+    assert "# TYPE size gauge\nsize 3\n" in text
+    assert ('# TYPE hits_total counter\nhits_total{cache="x"} 1\n'
+            'hits_total{cache="y"} 2\n') in text
+    assert 'wait_seconds_bucket{le="0.001"} 1\n' in text
+    assert "wait_seconds_count 1\n" in text
+
+
+def test_get_metrics():
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    for name in ["db_pool_checked_out", "result_cache_hits_total",
+                 "reference_cache_size", "write_coalescer_batches_total"]:
+        assert f"# TYPE {name} " in response.text
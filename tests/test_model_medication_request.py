@@ -11,10 +11,14 @@ from app.models.medication_request import MedicationRequest
 from app.models.medication_request import MedicationRequestInput
 from app.models.medication_request import MedicationRequestPatch
 from app.models.medication_request import MedicationRequestOutput
+from app.models.medication_request import MedicationRequestCursor
+from app.models.medication_request import MedicationRequestQueryParams
 from app.models.types import MedicationRequestStatus, Sex, MedicationForm
+from app.models.types import ModelInvalidError
 from app.models.medication import Medication
 from app.models.clinician import Clinician
 from app.models.patient import Patient
+from app import settings
 
 
 def test_dictionary_medication_request():
@@ -93,6 +97,23 @@ def test_deserialize_medication_request_patch():
     assert new_medication_request.frequency == "3 times/day"
     assert new_medication_request.status == MedicationRequestStatus.COMPLETED
 
+
+def test_medication_request_cursor():
+    cursor = MedicationRequestCursor(prescribed_date=date(2024, 1, 5), id=7)
+    encoded = cursor.encode()
+    assert MedicationRequestCursor.decode(encoded) == cursor
+    assert MedicationRequestQueryParams(cursor=encoded, limit=10)
+    for bad_cursor in ["bad", "", "e30="]:
+        with pytest.raises(ModelInvalidError):
+            MedicationRequestQueryParams(cursor=bad_cursor)
+    with pytest.raises(ValueError):
+        MedicationRequestQueryParams(limit=0)
+    query_params = MedicationRequestQueryParams(cursor=encoded)
+    assert query_params.position == cursor
+    assert query_params.limit == settings.MEDICATION_REQUESTS_DEFAULT_LIMIT
+    assert MedicationRequestQueryParams().position is None
+
+
 @pytest.fixture()
 def the_patient(session):
     the_patient = Patient(
@@ -228,3 +249,12 @@ def test_medication_request_change_clinician(
     session.refresh(new_medication_request)
     assert new_medication_request.clinician != the_clinician
     assert new_medication_request.clinician == new_clinician
+
+
+def test_medication_request_indexes():
+    indexes = {tuple(column.name for column in index.columns)
+               for index in MedicationRequest.__table__.indexes}
+    assert ("patient_id", "prescribed_date", "id") in indexes
+    assert ("patient_id", "status", "prescribed_date", "id") in indexes
+    assert ("clinician_id",) in indexes
+    assert ("medication_id",) in indexes
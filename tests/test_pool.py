@@ -0,0 +1,49 @@
+"""Tests for the pool.py module."""
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import pool
+from app.database import connect_options, pool_options
+from app.metrics import registry
+
+
+def test_pool_options():
+    assert pool_options("sqlite+aiosqlite://", "x") == {}
+    assert pool_options("sqlite+aiosqlite:///:memory:", "x") == {}
+    options = pool_options("sqlite+aiosqlite:///file.db", "x")
+    assert options["poolclass"] is pool.InstrumentedQueuePool
+    assert options["pool_logging_name"] == "x"
+    assert options["pool_size"] == 5
+
+
+def test_connect_options():
+    assert connect_options("sqlite+aiosqlite:///file.db") == {}
+    options = connect_options("postgresql+asyncpg://user@host/db")
+    assert options["connect_args"]["prepared_statement_cache_size"] == 100
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=pool.InstrumentedQueuePool, pool_logging_name="test",
+        pool_size=1, max_overflow=0, pool_timeout=0.01)
+    pool.watch("test", engine)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert 'db_pool_checked_out{pool="test"} 1' in registry.render()
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+        assert pool.checkout_seconds.count("test") == 2
+        text_format = registry.render()
+        assert 'db_pool_checked_out{pool="test"} 0' in text_format
+        assert 'db_pool_checkout_timeouts_total{pool="test"} 1' in text_format
+        assert 'db_pool_checkout_seconds_count{pool="test"} 2' in text_format
+        assert pool.hold_seconds.count("test") == 1
+    finally:
+        pool._engines.pop("test")
+        await engine.dispose()
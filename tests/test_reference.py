@@ -0,0 +1,34 @@
+"""Tests for the reference.py module."""
+
+import pytest
+
+from app import reference
+from app.models.medication import Medication
+from . import data
+
+
+@pytest.mark.asyncio
+async def test_resolve_names_db(async_session):
+    async for db_session in async_session:
+        await data.add_clinician(3, db_session)
+        await data.add_medication(4, db_session)
+
+        medications, clinicians = await reference.resolve_names(
+            db_session, [4, 4], [3])
+        assert medications[4].code_name == "Oxamniquine"
+        assert clinicians[3].first_name == "John"
+        assert reference.stats()["medication"]["misses"] == 1
+
+        # Served from the cache:
+        medications, clinicians = await reference.resolve_names(
+            db_session, [4], [3])
+        assert medications[4].code_name == "Oxamniquine"
+        assert reference.stats()["medication"]["hits"] == 1
+        assert reference.stats()["clinician"]["hits"] == 1
+
+        # An ORM update invalidates the cached entry:
+        medication = await db_session.get(Medication, 4)
+        medication.code_name = "Renamed"
+        await db_session.commit()
+        medications, _ = await reference.resolve_names(db_session, [4], [])
+        assert medications[4].code_name == "Renamed"
@@ -0,0 +1,69 @@
+"""Tests for the replicas.py module."""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import replicas, settings
+from app.metrics import registry
+
+
+@pytest_asyncio.fixture(name="replica_set")
+async def fixture_replica_set(tmp_path):
+    replica_set = replicas.ReplicaSet([
+        replicas.Replica(f"test{number}", create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / f'replica{number}.db'}"))
+        for number in range(3)])
+    yield replica_set
+    for replica in replica_set.replicas:
+        await replica.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_round_robin(replica_set):
+    assert replica_set.choose(1) is None  # not checked yet
+    await replica_set.check_health()
+    makers = [replica.session_maker for replica in replica_set.replicas]
+    assert [replica_set.choose(1) for _ in range(4)] == makers + makers[:1]
+    replica_set.replicas[2].healthy = False
+    assert [replica_set.choose(1) for _ in range(3)] == [
+        makers[1], makers[0], makers[1]]
+
+
+@pytest.mark.asyncio
+async def test_read_your_writes(replica_set):
+    await replica_set.check_health()
+    assert replica_set.choose(1, read_primary=True) is None
+    replicas.record_write(1)
+    assert replica_set.choose(1) is None
+    assert replica_set.choose(2) is not None
+    with patch.object(replicas.recent_writes, "ttl", 0):
+        replicas.record_write(1)
+    assert replica_set.choose(1) is not None
+
+
+@pytest.mark.asyncio
+async def test_health_check(replica_set, tmp_path):
+    failing = replicas.Replica("test-failing", create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    replica_set.replicas.append(failing)
+    replicas.watch(failing)
+    await replica_set.check_health()
+    assert [replica.healthy for replica in replica_set.replicas] == [
+        True, True, True, False]
+    assert failing.lag_seconds is None
+    text_format = registry.render()
+    assert 'db_replica_healthy{replica="test-failing"} 0' in text_format
+    assert 'db_replica_lag_seconds{replica="test-failing"} -1' in text_format
+
+    lagging = replica_set.replicas[0]
+    with patch.object(lagging, "read_lag", new_callable=AsyncMock,
+                      return_value=settings.DATABASE_REPLICA_MAX_LAG_SECONDS
+                      + 1):
+        await replica_set.check_health()
+    assert not lagging.healthy
+    await replica_set.check_health()
+    assert lagging.healthy
+    assert lagging.lag_seconds == 0
@@ -0,0 +1,24 @@
+"""Tests for the serialization.py module."""
+
+import json
+
+from app import serialization
+from app.models.medication_request import MedicationRequestOutput
+from . import data
+
+
+def test_output_from_row():
+    expected = data.valid_medication_request
+    output = serialization.output_from_row(
+        expected, expected.medication, expected.clinician)
+    assert isinstance(output, MedicationRequestOutput)
+    assert output == expected
+
+
+def test_dump_json():
+    expected = data.valid_medication_request
+    assert (json.loads(serialization.dump_json(expected))
+            == json.loads(expected.model_dump_json()))
+    assert (json.loads(serialization.dump_json([expected, expected]))
+            == [json.loads(expected.model_dump_json())] * 2)
+    assert serialization.dump_json([]) == b"[]"
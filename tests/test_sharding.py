@@ -0,0 +1,90 @@
+"""Tests for the sharding.py module and the rebalance command."""
+
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app import crud, settings, sharding
+from app.commands import rebalance
+from app.models.idempotency_key import IdempotencyKey
+from app.models.medication_request import MedicationRequest
+from app.models.patient import Patient
+from app.models.patient_shard import PatientShard
+from . import data
+
+
+@pytest_asyncio.fixture(name="shard_urls")
+async def fixture_shard_urls(tmp_path):
+    """Make three shards, with patient 4 (by default on shard 1)."""
+    urls = [f"sqlite+aiosqlite:///{tmp_path / f'shard{n}.db'}"
+            for n in range(3)]
+    for number, url in enumerate(urls):
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with async_sessionmaker(engine)() as db:
+            await data.add_clinician(3, db)
+            await data.add_medication(5, db)
+            if number == 1:
+                await data.add_patient(4, db)
+                await data.add_medication_request(10, 4, 3, 5, db)
+                await data.add_medication_request(11, 4, 3, 5, db)
+                await db.execute(insert(IdempotencyKey), [{
+                    "key": "abc", "fingerprint": "f",
+                    "medication_request_id": 11, "response_body": "{}",
+                    "created_at": datetime.now()}])
+                await db.commit()
+        await engine.dispose()
+    return urls
+
+
+async def count_rows(url: str, model, **criteria) -> int:
+    engine = create_async_engine(url)
+    async with async_sessionmaker(engine)() as db:
+        query = select(func.count()).select_from(model).filter_by(**criteria)
+        count = (await db.execute(query)).scalar()
+    await engine.dispose()
+    return count
+
+
+@pytest.mark.asyncio
+async def test_read_shard(shard_urls):
+    engine = create_async_engine(shard_urls[0])
+    async with async_sessionmaker(engine)() as db:
+        assert await sharding.read_shard(db, 4, 3) == 1
+        assert await sharding.read_shard(db, 6, 3) == 0
+        db.add(PatientShard(patient_id=6, shard=2))
+        await db.commit()
+        assert await sharding.read_shard(db, 6, 3) == 0  # cached
+        sharding.directory_cache.clear()
+        assert await sharding.read_shard(db, 6, 3) == 2
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_rebalance(shard_urls, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", shard_urls[0])
+    with patch.object(settings, "DATABASE_SHARD_URLS", shard_urls[1:]):
+        await rebalance.main(["4", "2"])
+        await rebalance.main(["4", "2"])  # already there
+
+        with pytest.raises(crud.ResourceNotFoundError):
+            await rebalance.main(["7", "2"])
+        with pytest.raises(SystemExit):
+            await rebalance.main(["4", "3"])
+
+    for model, criteria in [(Patient, {"id": 4}),
+                            (MedicationRequest, {"patient_id": 4}),
+                            (IdempotencyKey, {})]:
+        assert await count_rows(shard_urls[1], model, **criteria) == 0
+    assert await count_rows(shard_urls[2], Patient, id=4) == 1
+    assert await count_rows(shard_urls[2], MedicationRequest,
+                            patient_id=4) == 2
+    assert await count_rows(shard_urls[2], IdempotencyKey) == 1
+    assert await count_rows(shard_urls[0], PatientShard, patient_id=4,
+                            shard=2) == 1